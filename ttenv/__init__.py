@@ -1,5 +1,50 @@
+import functools
+import importlib
 from gym import wrappers
-from ttenv import target_tracking, target_imtracking
+
+# env_name : (module, class name, the number of local map images for display)
+# The modules are imported on the first make() call of their environments so
+# that the infoplanner environments do not require the infoplanner library
+# unless they are used.
+_ENV_REGISTRY = {
+    'TargetTracking-v0': ('ttenv.target_tracking', 'TargetTrackingEnv0', 0),
+    'TargetTracking-v1': ('ttenv.target_tracking', 'TargetTrackingEnv1', 0),
+    'TargetTracking-v2': ('ttenv.target_tracking', 'TargetTrackingEnv2', 0),
+    'TargetTracking-v3': ('ttenv.target_tracking', 'TargetTrackingEnv3', 0),
+    'TargetTracking-v4': ('ttenv.target_imtracking', 'TargetTrackingEnv4', 1),
+    'TargetTracking-v5': ('ttenv.target_imtracking', 'TargetTrackingEnv5', 5),
+    'TargetTracking-info1': ('ttenv.infoplanner_python.target_tracking_infoplanner',
+                                'TargetTrackingInfoPlanner1', 0),
+    'TargetTracking-info2': ('ttenv.infoplanner_python.target_tracking_infoplanner',
+                                'TargetTrackingInfoPlanner2', 0),
+}
+
+class _TimeLimit(object):
+    """
+    gym.wrappers.TimeLimit inlined into an environment class. make() uses it
+    for environments without any other wrapper to save a wrapper frame per
+    step. It has no env attribute, use env.unwrapped to reach the core
+    environment whether or not make() wrapped it.
+    """
+    _max_episode_steps = None
+    _elapsed_steps = None
+
+    def reset(self, **kwargs):
+        self._elapsed_steps = 0
+        return super().reset(**kwargs)
+
+    def step(self, action):
+        assert self._elapsed_steps is not None, "Cannot call env.step() before calling reset()"
+        observation, reward, done, info = super().step(action)
+        self._elapsed_steps += 1
+        if self._elapsed_steps >= self._max_episode_steps:
+            info['TimeLimit.truncated'] = not done
+            done = True
+        return observation, reward, done, info
+
+@functools.lru_cache(maxsize=None)
+def _time_limit_class(env_class):
+    return type(env_class.__name__, (_TimeLimit, env_class), {})
 
 def make(env_name, render=False, figID=0, record=False, ros=False, directory='',
                                         T_steps=None, num_targets=1, **kwargs):
@@ -30,30 +75,16 @@ def make(env_name, render=False, figID=0, record=False, ros=False, directory='',
     #         T_steps = 100
     T_steps = 100
 
-    local_view = 0
-    if env_name == 'TargetTracking-v0':
-        env0 = target_tracking.TargetTrackingEnv0(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-v1':
-        env0 = target_tracking.TargetTrackingEnv1(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-v2':
-        env0 = target_tracking.TargetTrackingEnv2(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-v3':
-        env0 = target_tracking.TargetTrackingEnv3(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-v4':
-        local_view = 1
-        env0 = target_imtracking.TargetTrackingEnv4(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-v5':
-        local_view = 5
-        env0 = target_imtracking.TargetTrackingEnv5(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-info1':
-        from ttenv.infoplanner_python.target_tracking_infoplanner import TargetTrackingInfoPlanner1
-        env0 = TargetTrackingInfoPlanner1(num_targets=num_targets, **kwargs)
-    elif env_name == 'TargetTracking-info2':
-        from ttenv.infoplanner_python.target_tracking_infoplanner import TargetTrackingInfoPlanner2
-        env0 = TargetTrackingInfoPlanner2(num_targets=num_targets, **kwargs)
-    else:
+    if env_name not in _ENV_REGISTRY:
         raise ValueError('No such environment exists.')
+    module_name, class_name, local_view = _ENV_REGISTRY[env_name]
+    env_class = getattr(importlib.import_module(module_name), class_name)
+    if not(ros or render or record):
+        env = _time_limit_class(env_class)(num_targets=num_targets, **kwargs)
+        env._max_episode_steps = T_steps
+        return env
 
+    env0 = env_class(num_targets=num_targets, **kwargs)
     env = wrappers.TimeLimit(env0, max_episode_steps=T_steps)
     if ros:
         from ttenv.ros_wrapper import Ros
@@ -66,3 +97,12 @@ def make(env_name, render=False, figID=0, record=False, ros=False, directory='',
         env = Video2D(env, dirname = directory, local_view=local_view)
 
     return env
+
+def make_vec(env_name, num_envs, n_s=1, seed=None, **kwargs):
+    """
+    Returns num_envs environments of env_name stepped in parallel with one Ray
+    actor per environment. See ttenv/vec_env.py. Requires ray.
+    kwargs are passed to make() in each actor.
+    """
+    from ttenv.vec_env import RayVecEnv
+    return RayVecEnv(env_name, num_envs, n_s=n_s, seed=seed, **kwargs)
@@ -0,0 +1,55 @@
+"""Opt-in profiling of the target tracking environments with cProfile.
+
+Set the environment variable TT_PROFILE=1 to profile step() and reset() of
+every environment. The stats of an environment are written to
+ttenv_<env id>_<pid>_<n>.prof in TT_PROFILE_DIR (the current directory by
+default), n counting the profiled environments of the process, when the
+environment is closed or at the interpreter exit if it is not closed, e.g.
+    TT_PROFILE=1 python run_script.py
+    snakeviz ttenv_TargetTracking-v1_1234_0.prof
+It has no cost when TT_PROFILE is not set.
+"""
+import atexit
+import cProfile
+import functools
+import itertools
+import os
+
+_counter = itertools.count()
+
+
+def is_enabled():
+    return os.environ.get('TT_PROFILE', '0') not in ('', '0')
+
+def profileit(profile, func):
+    """Returns func running under the cProfile.Profile profile."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+    return wrapper
+
+class EnvProfiler(object):
+    def __init__(self, env):
+        self.env = env
+        self.profile = cProfile.Profile()
+        self.index = next(_counter)
+        env.step = profileit(self.profile, env.step)
+        env.reset = profileit(self.profile, env.reset)
+        atexit.register(self.dump)
+
+    def dump(self):
+        path = os.path.join(os.environ.get('TT_PROFILE_DIR', '.'),
+                    'ttenv_%s_%d_%d.prof'%(getattr(self.env, 'id', 'env'), os.getpid(),
+                                            self.index))
+        self.profile.dump_stats(path)
+        return path
+
+    def close(self):
+        """Dumps the stats and releases the environment held by atexit."""
+        path = self.dump()
+        atexit.unregister(self.dump)
+        return path
@@ -4,6 +4,8 @@ The following models are included:
 
     AgentDoubleInt2D : Double Integrator Model in 2D
                         state: x,y,xdot,ydot
+    double_int_2d_update_batch : AgentDoubleInt2D update for multiple targets
+                        stored in a shared array (see state_buf of Agent)
     AgentDoubleInt2D_Nonlinear : Double Integrator Model with non-linear term for obstalce avoidance in 2D
                         state: x,y,xdot,ydot
     AgentSE2 : SE2 Model
@@ -17,12 +19,30 @@ from ttenv.metadata import METADATA
 import ttenv.util as util
 
 class Agent(object):
-    def __init__(self, dim, sampling_period, limit, collision_func, margin=METADATA['margin']):
+    def __init__(self, dim, sampling_period, limit, collision_func, margin=METADATA['margin'],
+                    state_buf=None):
+        """
+        state_buf : an optional (dim,) array where the state is stored, e.g. a
+                row of an array shared by all targets. It is updated in place.
+        """
         self.dim = dim
         self.sampling_period = sampling_period
         self.limit = limit
         self.collision_func = collision_func
         self.margin = margin
+        self._state_buf = state_buf
+        self._state = state_buf
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        if self._state_buf is None:
+            self._state = value
+        else:
+            self._state_buf[:] = value
 
     def range_check(self):
         self.state = np.clip(self.state, self.limit[0], self.limit[1])
@@ -38,8 +58,9 @@ class Agent(object):
 
 class AgentDoubleInt2D(Agent):
     def __init__(self, dim, sampling_period, limit, collision_func,
-                    margin=METADATA['margin'], A=None, W=None):
-        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin)
+                    margin=METADATA['margin'], A=None, W=None, state_buf=None):
+        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin,
+                        state_buf=state_buf)
         self.A = np.eye(self.dim) if A is None else A
         self.W = W
 
@@ -58,11 +79,31 @@ class AgentDoubleInt2D(Agent):
         self.range_check()
         return is_col
 
+def double_int_2d_update_batch(states, idx, A, W, collision_batch_func, limit):
+    """
+    AgentDoubleInt2D.update for the targets states[idx] sharing the same A, W,
+    and limit, in place. The noise of all targets is drawn in a single call.
+    states : [N, dim] target states.
+    idx : [M,] indices of the targets to update.
+    collision_batch_func : batch collision checking function, e.g.
+                            GridMap.is_collision_batch.
+    OUTPUT: [M,] boolean array, True if a target collided.
+    """
+    new_states = np.matmul(states[idx], A.T)
+    if W is not None:
+        new_states += np.random.multivariate_normal(np.zeros(states.shape[-1]), W,
+                                                    size=len(idx))
+    is_col = collision_batch_func(new_states[:,:2])
+    new_states[is_col,:2] = states[idx[is_col],:2]
+    states[idx] = np.clip(new_states, limit[0], limit[1])
+    return is_col
+
 class AgentDoubleInt2D_Nonlinear(AgentDoubleInt2D):
     def __init__(self, dim, sampling_period, limit, collision_func,
-                    margin=METADATA['margin'], A=None, W=None, obs_check_func=None):
+                    margin=METADATA['margin'], A=None, W=None, obs_check_func=None,
+                    state_buf=None):
         AgentDoubleInt2D.__init__(self, dim, sampling_period, limit,
-            collision_func, margin=margin, A=A, W=W)
+            collision_func, margin=margin, A=A, W=W, state_buf=state_buf)
         self.obs_check_func = obs_check_func
 
     def update(self, margin_pos=None):
@@ -143,8 +184,10 @@ class AgentDoubleInt2D_Nonlinear(AgentDoubleInt2D):
 
 class AgentSE2(Agent):
     def __init__(self, dim, sampling_period, limit, collision_func,
-                                        margin=METADATA['margin'], policy=None):
-        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin)
+                                        margin=METADATA['margin'], policy=None,
+                                        state_buf=None):
+        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin,
+                        state_buf=state_buf)
         self.policy = policy
 
     def reset(self, init_state):
@@ -194,8 +237,10 @@ class Agent2DFixedPath(Agent):
     number of time steps in a trajectory (or per episode). Each row consists
     of (x, y, xdot, ydot).
     """
-    def __init__(self, dim, sampling_period, limit, collision_func, path, margin=METADATA['margin']):
-        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin)
+    def __init__(self, dim, sampling_period, limit, collision_func, path, margin=METADATA['margin'],
+                    state_buf=None):
+        Agent.__init__(self, dim, sampling_period, limit, collision_func, margin=margin,
+                        state_buf=state_buf)
         self.path = path
 
     def update(self, margin_pos=None):
@@ -206,7 +251,11 @@ class Agent2DFixedPath(Agent):
 
     def reset(self, init_state):
         self.t = 0
-        self.state = init_state
+        if len(init_state) == 4:
+            self.state = init_state
+        else:
+            # Only the position is used if init_state is not (x, y, xdot, ydot).
+            self.state = np.concatenate((init_state[:2], np.zeros(2)))
 
 def SE2Dynamics(x, dt, u):
     """
@@ -228,6 +277,24 @@ def SE2Dynamics(x, dt, u):
     new_x[2] = util.wrap_around(new_x[2])
     return new_x
 
+def SE2Dynamics_batch(x, dt, u):
+    """
+    Batch version of SE2Dynamics for states x [K, 3], e.g. the sigma points of
+    a UKF, with a control input u [2,] shared by all states or [K, 2].
+    """
+    u = np.broadcast_to(u, (len(x), 2))
+    tw = dt * u[:,1]
+    is_small = np.abs(tw) < 0.001
+    v_w = u[:,0] / np.where(is_small, 1.0, u[:,1])
+    th = x[:,2]
+    new_x = np.empty(x.shape)
+    new_x[:,0] = x[:,0] + np.where(is_small, dt*u[:,0]*np.cos(th+tw/2),
+                                        v_w*(np.sin(th+tw) - np.sin(th)))
+    new_x[:,1] = x[:,1] + np.where(is_small, dt*u[:,0]*np.sin(th+tw/2),
+                                        v_w*(np.cos(th) - np.cos(th+tw)))
+    new_x[:,2] = util.wrap_around_batch(th + tw)
+    return new_x
+
 def SE2DynamicsVel(x, dt, u=None):
     """
     update dynamics function for contant linear and angular velocities
@@ -237,3 +304,14 @@ def SE2DynamicsVel(x, dt, u=None):
         u = x[-2:]
     odom = SE2Dynamics(x[:3], dt, u)
     return np.concatenate((odom, u))
+
+def SE2DynamicsVel_batch(x, dt, u=None):
+    """
+    Batch version of SE2DynamicsVel for states x [K, 5].
+    """
+    if u is None:
+        u = x[:,-2:]
+    new_x = np.empty(x.shape)
+    new_x[:,:3] = SE2Dynamics_batch(x[:,:3], dt, u)
+    new_x[:,3:] = u
+    return new_x
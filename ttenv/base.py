@@ -17,6 +17,10 @@ from ttenv.metadata import METADATA
 import ttenv.util as util
 
 from ttenv.maps.dynamic_map import DynamicMap
+from ttenv import _profile
+
+# The number of random poses drawn at once when sampling initial poses.
+RAND_POSE_BATCH = 32
 
 class TargetTrackingBase(gym.Env):
     def __init__(self, num_targets=1, map_name='empty',
@@ -26,11 +30,10 @@ class TargetTrackingBase(gym.Env):
         self.state = None
         self.action_space = spaces.Discrete(len(METADATA['action_v']) * \
                                                     len(METADATA['action_w']))
-        self.action_map = {}
-        for (i,v) in enumerate(METADATA['action_v']):
-            for (j,w) in enumerate(METADATA['action_w']):
-                self.action_map[len(METADATA['action_w'])*i+j] = (v,w)
-        assert(len(self.action_map.keys())==self.action_space.n)
+        # (v, w) of the action len(METADATA['action_w'])*i+j at its index.
+        self.action_map = tuple((v,w) for v in METADATA['action_v']
+                                        for w in METADATA['action_w'])
+        assert(len(self.action_map)==self.action_space.n)
 
         self.num_targets = num_targets
         self.viewer = None
@@ -39,8 +42,16 @@ class TargetTrackingBase(gym.Env):
         self.sampling_period = 0.5 # sec
         self.sensor_r_sd = METADATA['sensor_r_sd']
         self.sensor_b_sd = METADATA['sensor_b_sd']
+        # The observation noise covariance is constant. It is shared by all
+        # callers of observation_noise and therefore read-only.
+        self._obs_noise_cov = np.array([[self.sensor_r_sd * self.sensor_r_sd, 0.0],
+                                [0.0, self.sensor_b_sd * self.sensor_b_sd]])
+        self._obs_noise_cov.flags.writeable = False
+        # Its Cholesky factor is used to sample the observation noise.
+        self._obs_noise_L = LA.cholesky(self._obs_noise_cov)
         self.sensor_r = METADATA['sensor_r']
         self.fov = METADATA['fov']
+        self._fov_rad_half = self.fov/2/180*np.pi
 
         map_dir_path = '/'.join(map_utils.__file__.split('/')[:-1])
         if 'dynamic_map' in map_name :
@@ -59,9 +70,16 @@ class TargetTrackingBase(gym.Env):
 
         self.reset_num = 0
 
+        # Profiles step and reset if TT_PROFILE is set (see ttenv/_profile.py).
+        self._profiler = _profile.EnvProfiler(self) if _profile.is_enabled() else None
+
+    def close(self):
+        if self._profiler is not None:
+            self._profiler.close()
+
     def reset(self, **kwargs):
         self.MAP.generate_map(**kwargs)
-        self.has_discovered = [1] * self.num_targets # Set to 0 values for your evaluation purpose.
+        self.has_discovered = np.ones(self.num_targets, dtype=np.int8) # Set to 0 values for your evaluation purpose.
         self.state = []
         self.num_collisions = 0
         return self.get_init_pose(**kwargs)
@@ -69,13 +87,11 @@ class TargetTrackingBase(gym.Env):
     def step(self, action):
         # The agent performs an action (t -> t+1)
         action_vw = self.action_map[action]
-        is_col = self.agent.update(action_vw, [t.state[:2] for t in self.targets])
+        is_col = self.agent.update(action_vw, self.target_states[:,:2])
         self.num_collisions += int(is_col)
 
         # The targets move (t -> t+1)
-        for i in range(self.num_targets):
-            if self.has_discovered[i]:
-                self.targets[i].update(self.agent.state[:2])
+        self.update_targets()
 
         # The targets are observed by the agent (z_t+1) and the beliefs are updated.
         observed = self.observe_and_update_belief()
@@ -84,8 +100,7 @@ class TargetTrackingBase(gym.Env):
         reward, done, mean_nlogdetcov, std_nlogdetcov = self.get_reward(self.is_training,
                                                                 is_col=is_col)
         # Predict the target for the next step, b_t+2|t+1
-        for i in range(self.num_targets):
-            self.belief_targets[i].predict()
+        self.predict_beliefs()
 
         # Compute the RL state.
         self.state_func(action_vw, observed)
@@ -116,8 +131,8 @@ class TargetTrackingBase(gym.Env):
             return self.get_init_pose_random(**kwargs)
 
     def gen_rand_pose(self, frame_xy, frame_theta, min_lin_dist, max_lin_dist,
-            min_ang_dist, max_ang_dist, additional_frame=None):
-        """Genertes random position and yaw.
+            min_ang_dist, max_ang_dist, additional_frame=None, batch=1):
+        """Genertes a batch of random positions and yaws.
         Parameters
         --------
         frame_xy, frame_theta : xy and theta coordinate of the frame you want to compute a distance from.
@@ -125,19 +140,39 @@ class TargetTrackingBase(gym.Env):
         max_lin_dist : the maximum linear distance from o_xy to a sample point.
         min_ang_dist : the minimum angular distance (counter clockwise direction) from c_theta to a sample point.
         max_ang_dist : the maximum angular distance (counter clockwise direction) from c_theta to a sample point.
+        batch : the number of samples.
+        OUTPUT: [batch,] boolean array of validity and [batch, 3] array of poses
         """
         if max_ang_dist < min_ang_dist:
             max_ang_dist += 2*np.pi
-        rand_ang = util.wrap_around(np.random.rand() * \
+        rand_ang, rand_r = np.random.rand(2, batch)
+        rand_ang = util.wrap_around_batch(rand_ang * \
                         (max_ang_dist - min_ang_dist) + min_ang_dist)
-
-        rand_r = np.random.rand() * (max_lin_dist - min_lin_dist) + min_lin_dist
-        rand_xy = np.array([rand_r*np.cos(rand_ang), rand_r*np.sin(rand_ang)])
-        rand_xy_global = util.transform_2d_inv(rand_xy, frame_theta, np.array(frame_xy))
+        rand_r = rand_r * (max_lin_dist - min_lin_dist) + min_lin_dist
+        rand_xy = np.stack([rand_r*np.cos(rand_ang), rand_r*np.sin(rand_ang)], axis=-1)
+        rand_xy_global = util.transform_2d_inv_batch(rand_xy, frame_theta, frame_xy)
         if additional_frame:
-            rand_xy_global = util.transform_2d_inv(rand_xy_global, additional_frame[2], np.array(additional_frame[:2]))
-        is_valid = not(self.MAP.is_collision(rand_xy_global))
-        return is_valid, [rand_xy_global[0], rand_xy_global[1], rand_ang + frame_theta]
+            rand_xy_global = util.transform_2d_inv_batch(rand_xy_global, additional_frame[2], additional_frame[:2])
+        is_valid = ~self.MAP.is_collision_batch(rand_xy_global)
+        return is_valid, np.column_stack((rand_xy_global, rand_ang + frame_theta))
+
+    def gen_valid_rand_pose(self, agent_xy, frame_xy, frame_theta, lin_dist_range,
+            ang_dist_range, blocked=None, max_count=100, batch=RAND_POSE_BATCH):
+        """Draws random poses in batches until a valid one is found.
+        A pose is valid if it is collision free and, when blocked is given,
+        its line of sight from agent_xy is blocked iff blocked is True.
+        Returns None if no valid pose is found in max_count samples.
+        """
+        count = 0
+        while(count < max_count):
+            is_valid, poses = self.gen_rand_pose(frame_xy, frame_theta,
+                                lin_dist_range[0], lin_dist_range[1],
+                                ang_dist_range[0], ang_dist_range[1], batch=batch)
+            for j in np.flatnonzero(is_valid):
+                if (blocked is None) or (blocked == self.MAP.is_blocked(agent_xy, poses[j,:2])):
+                    return list(poses[j])
+            count += batch
+        return None
 
     def get_init_pose_random(self,
                             lin_dist_range_a2b=METADATA['lin_dist_range_a2b'],
@@ -155,41 +190,28 @@ class TargetTrackingBase(gym.Env):
                 is_agent_valid = True
             else:
                 while(not is_agent_valid):
-                    a_init = np.random.random((2,)) * (self.MAP.mapmax-self.MAP.mapmin) + self.MAP.mapmin
-                    is_agent_valid = not(self.MAP.is_collision(a_init))
+                    a_init = np.random.random((RAND_POSE_BATCH, 2)) \
+                                * (self.MAP.mapmax-self.MAP.mapmin) + self.MAP.mapmin
+                    valid = np.flatnonzero(~self.MAP.is_collision_batch(a_init))
+                    is_agent_valid = len(valid) > 0
+                a_init = a_init[valid[0]]
 
             init_pose['agent'] = [a_init[0], a_init[1], np.random.random() * 2 * np.pi - np.pi]
             init_pose['targets'], init_pose['belief_targets'] = [], []
             for i in range(self.num_targets):
-                count, is_belief_valid = 0, False
-                while(not is_belief_valid):
-                    is_belief_valid, init_pose_belief = self.gen_rand_pose(
-                        init_pose['agent'][:2], init_pose['agent'][2],
-                        lin_dist_range_a2b[0], lin_dist_range_a2b[1],
-                        ang_dist_range_a2b[0], ang_dist_range_a2b[1])
-                    if is_belief_valid and (blocked is not None):
-                        is_blocked = self.MAP.is_blocked(init_pose['agent'][:2], init_pose_belief[:2])
-                        is_belief_valid = (blocked == is_blocked)
-                    count += 1
-                    if count > 100:
-                        is_agent_valid = False
-                        break
+                init_pose_belief = self.gen_valid_rand_pose(init_pose['agent'][:2],
+                                        init_pose['agent'][:2], init_pose['agent'][2],
+                                        lin_dist_range_a2b, ang_dist_range_a2b, blocked=blocked)
+                if init_pose_belief is None:
+                    is_agent_valid = False
+                    break
+                init_pose_target = self.gen_valid_rand_pose(init_pose['agent'][:2],
+                                        init_pose_belief[:2], init_pose_belief[2],
+                                        lin_dist_range_b2t, ang_dist_range_b2t, blocked=blocked)
+                if init_pose_target is None:
+                    is_agent_valid = False
+                    break
                 init_pose['belief_targets'].append(init_pose_belief)
-
-                count, is_target_valid, init_pose_target = 0, False, np.zeros((2,))
-                while((not is_target_valid) and is_belief_valid):
-                    is_target_valid, init_pose_target = self.gen_rand_pose(
-                        init_pose['belief_targets'][i][:2],
-                        init_pose['belief_targets'][i][2],
-                        lin_dist_range_b2t[0], lin_dist_range_b2t[1],
-                        ang_dist_range_b2t[0], ang_dist_range_b2t[1])
-                    if is_target_valid and (blocked is not None):
-                        is_blocked = self.MAP.is_blocked(init_pose['agent'][:2], init_pose_target[:2])
-                        is_target_valid = (blocked == is_blocked)
-                    count += 1
-                    if count > 100:
-                        is_agent_valid = False
-                        break
                 init_pose['targets'].append(init_pose_target)
         return init_pose
 
@@ -202,58 +224,117 @@ class TargetTrackingBase(gym.Env):
             2) current logdetcov index at each target dependent vector
             3) the number of target independent variables
         """
-        new_state = []
+        hist = []
         for i in range(self.num_targets):
             self.logdetcov_history[i].add(state[num_target_dep_vars*i+logdetcov_idx])
-            new_state = np.concatenate((new_state, state[num_target_dep_vars*i: num_target_dep_vars*i+logdetcov_idx]))
-            new_state = np.concatenate((new_state, self.logdetcov_history[i].get_values()))
-            new_state = np.concatenate((new_state, state[num_target_dep_vars*i+logdetcov_idx+1:num_target_dep_vars*(i+1)]))
-        new_state = np.concatenate((new_state, state[-num_target_indep_vars:]))
+            hist.append(self.logdetcov_history[i].get_values())
+        # Write all pieces into a single preallocated array by slices.
+        n_hist = len(hist[0])
+        n = num_target_dep_vars - 1 + n_hist
+        new_state = np.empty(n*self.num_targets + num_target_indep_vars, dtype=np.float32)
+        for i in range(self.num_targets):
+            s, t = num_target_dep_vars*i, n*i
+            new_state[t:t+logdetcov_idx] = state[s:s+logdetcov_idx]
+            new_state[t+logdetcov_idx:t+logdetcov_idx+n_hist] = hist[i]
+            new_state[t+logdetcov_idx+n_hist:t+n] = state[s+logdetcov_idx+1:s+num_target_dep_vars]
+        new_state[-num_target_indep_vars:] = state[-num_target_indep_vars:]
         return new_state
 
     def set_target_path(self, target_path):
+        # A path gives (x, y, xdot, ydot) of a target at each time step.
+        self.target_states = np.zeros((self.num_targets, 4))
         targets = [Agent2DFixedPath(dim=self.target_dim, sampling_period=self.sampling_period,
                                 limit=self.limit['target'],
-                                collision_func=lambda x: self.MAP.is_collision(x),
-                                path=target_path[i]) for i in range(self.num_targets)]
+                                collision_func=self.MAP.is_collision,
+                                path=target_path[i], state_buf=self.target_states[i])
+                                for i in range(self.num_targets)]
         self.targets = targets
 
+    def update_targets(self):
+        """
+        Moves the discovered targets.
+        """
+        for i in range(self.num_targets):
+            if self.has_discovered[i]:
+                self.targets[i].update(self.agent.state[:2])
+
     def observation(self, target):
         r, alpha = util.relative_distance_polar(target.state[:2],
                                             xy_base=self.agent.state[:2],
                                             theta_base=self.agent.state[2])
-        observed = (r <= self.sensor_r) \
-                    & (abs(alpha) <= self.fov/2/180*np.pi) \
-                    & (not(self.MAP.is_blocked(self.agent.state, target.state)))
+        # The line of sight is checked only for a target in the range and FOV.
+        observed = (r <= self.sensor_r) and (abs(alpha) <= self._fov_rad_half)
+        if observed:
+            observed = not(self.MAP.is_blocked(self.agent.state, target.state))
         z = None
         if observed:
             z = np.array([r, alpha])
-            z += np.random.multivariate_normal(np.zeros(2,), self.observation_noise(z))
+            z += np.matmul(self._obs_noise_L, np.random.standard_normal(2))
         return observed, z
 
     def observation_noise(self, z):
-        obs_noise_cov = np.array([[self.sensor_r_sd * self.sensor_r_sd, 0.0],
-                                [0.0, self.sensor_b_sd * self.sensor_b_sd]])
-        return obs_noise_cov
+        return self._obs_noise_cov
+
+    def observation_batch(self, targets_xy):
+        """
+        Observations of all targets at once.
+        targets_xy : [num_targets, 2] xy coordinates of the targets.
+        OUTPUT: [num_targets,] boolean array, True if a target is observed, and
+                [num_targets, 2] observations, valid only for the observed targets.
+        """
+        r, alpha = util.relative_distance_polar_batch(targets_xy,
+                                            xy_base=self.agent.state[:2],
+                                            theta_base=self.agent.state[2])
+        observed = (r <= self.sensor_r) & (np.abs(alpha) <= self._fov_rad_half)
+        # The line of sight is checked only for the targets in the range and FOV.
+        idx = np.flatnonzero(observed)
+        observed[idx] = ~self.MAP.is_blocked_batch(self.agent.state, targets_xy[idx])
+        z = np.stack((r, alpha), axis=-1)
+        z[observed] += np.matmul(np.random.standard_normal((np.count_nonzero(observed), 2)),
+                                    self._obs_noise_L.T)
+        return observed, z
 
     def observe_and_update_belief(self):
-        observed = []
-        for i in range(self.num_targets):
-            observation = self.observation(self.targets[i])
-            observed.append(observation[0])
-            if observation[0]: # if observed, update the target belief.
-                self.belief_targets[i].update(observation[1], self.agent.state)
-                if not(self.has_discovered[i]):
-                    self.has_discovered[i] = 1
+        observed, z = self.observation_batch(self.target_states[:,:2])
+        self.has_discovered[observed] = 1
+        # If observed, update the target beliefs.
+        self.update_beliefs(observed, z)
         return observed
 
+    def update_beliefs(self, observed, z):
+        """
+        Updates the beliefs of the observed targets with their observations z.
+        """
+        for i in np.flatnonzero(observed):
+            self.belief_targets[i].update(z[i], self.agent.state)
+
+    def predict_beliefs(self):
+        for i in range(self.num_targets):
+            self.belief_targets[i].predict()
+
     def get_reward(self, is_training=True, **kwargs):
-        return reward_fun(self.belief_targets, is_training=is_training, **kwargs)
+        # The belief covariances are already stacked in self.belief_covs.
+        return reward_fun(self.belief_targets, is_training=is_training,
+                            logdetcov=LA.slogdet(self.belief_covs)[1], **kwargs)
+
+def reward_fun(belief_targets, is_col, is_training=True, c_mean=0.1, c_std=0.0,
+                c_penalty=1.0, logdetcov=None):
+    """
+    logdetcov : precomputed log determinants of the belief covariances. They
+                are computed from belief_targets if not given.
+    """
+    if logdetcov is None:
+        # Log determinants of all belief covariances in a single call.
+        logdetcov = LA.slogdet(np.array([b_target.cov for b_target in belief_targets]))[1]
+    return reward_core(logdetcov, is_col, c_mean=c_mean, c_std=c_std, c_penalty=c_penalty)
 
-def reward_fun(belief_targets, is_col, is_training=True, c_mean=0.1, c_std=0.0, c_penalty=1.0):
-    detcov = [LA.det(b_target.cov) for b_target in belief_targets]
-    r_detcov_mean = - np.mean(np.log(detcov))
-    r_detcov_std = - np.std(np.log(detcov))
+def reward_core(logdetcov, is_col, c_mean=0.1, c_std=0.0, c_penalty=1.0):
+    """
+    reward_fun from the log determinants of the belief covariances.
+    """
+    mean_logdetcov, std_logdetcov = util.mean_std(logdetcov)
+    r_detcov_mean = - mean_logdetcov
+    r_detcov_std = - std_logdetcov
 
     reward = c_mean * r_detcov_mean + c_std * r_detcov_std
     if is_col :
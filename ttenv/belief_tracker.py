@@ -2,6 +2,11 @@
 
 KFbelief : Belief Update using Kalman Filter
 UKFbelief : Belief Update using Unscented Kalman Filter using filterpy library
+BatchUnscentedKalmanFilter : filterpy UnscentedKalmanFilter propagating all
+    sigma points with a single call of fx
+kf_predict_batch, kf_update_batch : KFbelief predict and update for multiple
+    beliefs stored in shared arrays (see state_buf and cov_buf of KFbelief)
+ukf_predict_batch : UKFbelief predict for multiple beliefs
 """
 import numpy as np
 from numpy import linalg as LA
@@ -18,7 +23,8 @@ class KFbelief(object):
     z : observation (r, alpha)
     """
     def __init__(self, dim, limit, dim_z=2, A=None, W=None,
-                    obs_noise_func=None, collision_func=None):
+                    obs_noise_func=None, collision_func=None,
+                    state_buf=None, cov_buf=None):
         """
         dim : dimension of state
         limit : An array of two vectors.
@@ -29,7 +35,12 @@ class KFbelief(object):
         W : state noise matrix
         obs_noise_func : observation noise matrix function of z
         collision_func : collision checking function
+        state_buf, cov_buf : optional (dim,) and (dim, dim) arrays where the
+                state and the covariance are stored, e.g. rows of arrays
+                shared by all beliefs. They are updated in place.
         """
+        self._state = np.zeros(dim) if state_buf is None else state_buf
+        self._cov = np.zeros((dim, dim)) if cov_buf is None else cov_buf
         self.dim = dim
         self.limit = limit
         self.A = np.eye(self.dim) if A is None else A
@@ -37,6 +48,22 @@ class KFbelief(object):
         self.obs_noise_func = obs_noise_func
         self.collision_func = collision_func
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state[:] = value
+
+    @property
+    def cov(self):
+        return self._cov
+
+    @cov.setter
+    def cov(self, value):
+        self._cov[:] = value
+
     def reset(self, init_state, init_cov):
         self.state = init_state
         self.cov = init_cov*np.eye(self.dim)
@@ -72,17 +99,77 @@ class KFbelief(object):
         R = np.matmul(np.matmul(Hmat, self.cov), Hmat.T) \
                                 + self.obs_noise_func((r_pred, alpha_pred))
         K = np.matmul(np.matmul(self.cov, Hmat.T), LA.inv(R))
-        C = np.eye(self.dim) - np.matmul(K, Hmat)
 
-        self.cov = np.matmul(C, self.cov)
+        # (I - KH)P computed as P - K(HP) with a (dim_z, dim) intermediate.
+        self.cov = self.cov - np.matmul(K, np.matmul(Hmat, self.cov))
         self.state = np.clip(self.state +  np.matmul(K, innov), self.limit[0], self.limit[1])
 
+def kf_predict_batch(states, covs, A, W, limit):
+    """
+    KFbelief.predict for beliefs sharing the same A, W, and limit.
+    states : [N, dim] belief states, updated in place.
+    covs : [N, dim, dim] belief covariances, updated in place.
+    """
+    np.clip(np.matmul(states, A.T), limit[0], limit[1], out=states)
+    covs[:] = np.matmul(np.matmul(A, covs), A.T) + W
+
+def kf_update_batch(states, covs, idx, z, x_t, obs_noise_func, limit):
+    """
+    KFbelief.update for the beliefs states[idx] and covs[idx] with their
+    observations z, in place.
+    idx : [M,] indices of the observed beliefs.
+    z : [M, 2] observations - radial and angular distances from the agent.
+    x_t : agent state (x, y, orientation) in the global frame.
+    """
+    state, cov = states[idx], covs[idx]
+    r_pred, alpha_pred = util.relative_distance_polar_batch(state[:,:2],
+                                                    x_t[:2], x_t[2])
+    diff_pred = state[:,:2] - x_t[:2]
+    Hmat = np.zeros((len(idx), 2, state.shape[-1]))
+    Hmat[:,0,:2] = diff_pred / r_pred[:,np.newaxis]
+    Hmat[:,1,0] = -diff_pred[:,1] / r_pred**2
+    Hmat[:,1,1] = diff_pred[:,0] / r_pred**2
+    innov = np.empty(z.shape)
+    innov[:,0] = z[:,0] - r_pred
+    innov[:,1] = util.wrap_around_batch(z[:,1] - alpha_pred)
+
+    # With symmetric P and R, K = P H^T R^-1 = (R^-1 (HP))^T, and HP is
+    # shared with the covariance update P - K(HP).
+    HP = np.matmul(Hmat, cov)
+    R = np.matmul(HP, np.swapaxes(Hmat, 1, 2)) \
+            + np.array([obs_noise_func(z_pred) for z_pred in zip(r_pred, alpha_pred)])
+    K = np.swapaxes(LA.solve(R, HP), 1, 2)
+
+    covs[idx] = cov - np.matmul(K, HP)
+    states[idx] = np.clip(state + np.matmul(K, innov[:,:,np.newaxis])[:,:,0],
+                            limit[0], limit[1])
+
+def cholesky_upper(P):
+    """
+    Upper triangular U with U'U = P, the sqrt_method of the sigma points.
+    Same as scipy.linalg.cholesky (the filterpy default) but faster for small
+    matrices.
+    """
+    return LA.cholesky(P).T
+
+class BatchUnscentedKalmanFilter(UnscentedKalmanFilter):
+    """
+    UnscentedKalmanFilter whose fx takes all sigma points [2n+1, n] at once,
+    e.g. SE2Dynamics_batch, instead of one sigma point at a time.
+    """
+    def compute_process_sigmas(self, dt, fx=None, **fx_args):
+        if fx is None:
+            fx = self.fx
+        sigmas = self.points_fn.sigma_points(self.x, self.P)
+        self.sigmas_f = fx(sigmas, dt, **fx_args)
+
 class UKFbelief(object):
     """
     Unscented Kalman Filter from filterpy
     """
     def __init__(self, dim, limit, dim_z=2, fx=None, W=None, obs_noise_func=None,
-                    collision_func=None, sampling_period=0.5, kappa=1):
+                    collision_func=None, sampling_period=0.5, kappa=1,
+                    state_buf=None, cov_buf=None, fx_batch=None):
         """
         dim : dimension of state
             ***Assuming dim==3: (x,y,theta), dim==4: (x,y,xdot,ydot), dim==5: (x,y,theta,v,w)
@@ -94,7 +181,13 @@ class UKFbelief(object):
         obs_noise_func : observation noise matrix function of z
         collision_func : collision checking function
         n : the number of sigma points
+        state_buf, cov_buf : optional (dim,) and (dim, dim) arrays where the
+                state and the covariance are stored as in KFbelief.
+        fx_batch : optional batch version of fx for states [K, dim]. If given,
+                it is used instead of fx to propagate all sigma points at once.
         """
+        self._state = np.zeros(dim) if state_buf is None else state_buf
+        self._cov = np.zeros((dim, dim)) if cov_buf is None else cov_buf
         self.dim = dim
         self.limit = limit
         self.W = W if W is not None else np.zeros((self.dim, self.dim))
@@ -107,42 +200,21 @@ class UKFbelief(object):
             return np.array([r_pred, alpha_pred])
 
         def x_mean_fn_(sigmas, Wm):
-            if dim == 3:
-                x = np.zeros(dim)
-                sum_sin, sum_cos = 0., 0.
-                for i in range(len(sigmas)):
-                    s = sigmas[i]
-                    x[0] += s[0] * Wm[i]
-                    x[1] += s[1] * Wm[i]
-                    sum_sin += np.sin(s[2])*Wm[i]
-                    sum_cos += np.cos(s[2])*Wm[i]
-                x[2] = np.arctan2(sum_sin, sum_cos)
-                return x
-            elif dim == 5:
-                x = np.zeros(dim)
-                sum_sin, sum_cos = 0., 0.
-                for i in range(len(sigmas)):
-                    s = sigmas[i]
-                    x[0] += s[0] * Wm[i]
-                    x[1] += s[1] * Wm[i]
-                    x[3] += s[3] * Wm[i]
-                    x[4] += s[4] * Wm[i]
-                    sum_sin += np.sin(s[2])*Wm[i]
-                    sum_cos += np.cos(s[2])*Wm[i]
-                x[2] = np.arctan2(sum_sin, sum_cos)
+            if dim == 3 or dim == 5:
+                # Weighted mean of all sigma points with the circular mean of
+                # the orientation.
+                x = np.dot(Wm, sigmas)
+                x[2] = np.arctan2(np.dot(Wm, np.sin(sigmas[:,2])),
+                                    np.dot(Wm, np.cos(sigmas[:,2])))
                 return x
             else:
                 return None
 
         def z_mean_fn_(sigmas, Wm):
-            x = np.zeros(dim_z)
-            sum_sin, sum_cos = 0., 0.
-            for i in range(len(sigmas)):
-                s = sigmas[i]
-                x[0] += s[0] * Wm[i]
-                sum_sin += np.sin(s[1])*Wm[i]
-                sum_cos += np.cos(s[1])*Wm[i]
-            x[1] = np.arctan2(sum_sin, sum_cos)
+            # Weighted mean of all sigma points with the circular mean of alpha.
+            x = np.dot(Wm, sigmas)
+            x[1] = np.arctan2(np.dot(Wm, np.sin(sigmas[:,1])),
+                                np.dot(Wm, np.cos(sigmas[:,1])))
             return x
 
         def residual_x_(x, xp):
@@ -166,18 +238,40 @@ class UKFbelief(object):
             r_z[1] = util.wrap_around(r_z[1])
             return r_z
 
-        sigmas = JulierSigmaPoints(n=dim, kappa=kappa)
-        self.ukf = UnscentedKalmanFilter(dim, dim_z, sampling_period, fx=fx,
-                    hx=hx, points=sigmas, x_mean_fn=x_mean_fn_,
-                    z_mean_fn=z_mean_fn_, residual_x=residual_x_,
-                    residual_z=residual_z_)
+        sigmas = JulierSigmaPoints(n=dim, kappa=kappa, sqrt_method=cholesky_upper)
+        if fx_batch is None:
+            self.ukf = UnscentedKalmanFilter(dim, dim_z, sampling_period, fx=fx,
+                        hx=hx, points=sigmas, x_mean_fn=x_mean_fn_,
+                        z_mean_fn=z_mean_fn_, residual_x=residual_x_,
+                        residual_z=residual_z_)
+        else:
+            self.ukf = BatchUnscentedKalmanFilter(dim, dim_z, sampling_period,
+                        fx=fx_batch, hx=hx, points=sigmas, x_mean_fn=x_mean_fn_,
+                        z_mean_fn=z_mean_fn_, residual_x=residual_x_,
+                        residual_z=residual_z_)
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state[:] = value
+
+    @property
+    def cov(self):
+        return self._cov
+
+    @cov.setter
+    def cov(self, value):
+        self._cov[:] = value
 
     def reset(self, init_state, init_cov):
         self.state = init_state
         self.cov = init_cov*np.eye(self.dim)
-        self.ukf.x = self.state
-        self.ukf.P = self.cov
+        # The filter keeps its own copies, e.g. ukf.x is not clipped.
+        self.ukf.x = self.state.copy()
+        self.ukf.P = self.cov.copy()
         self.ukf.Q = self.W # process noise matrix
 
     def predict(self, u_t=None):
@@ -198,3 +292,14 @@ class UKFbelief(object):
 
         self.cov = self.ukf.P
         self.state = np.clip(self.ukf.x, self.limit[0], self.limit[1])
+
+def ukf_predict_batch(beliefs):
+    """
+    UKFbelief.predict for multiple beliefs. The random control inputs of all
+    beliefs are drawn in a single call, in the same order as drawn by
+    UKFbelief.predict one by one.
+    """
+    u = np.random.random((len(beliefs), 2))
+    u[:,1] = np.pi*u[:,1] - 0.5*np.pi
+    for (b, u_t) in zip(beliefs, u):
+        b.predict(u_t)
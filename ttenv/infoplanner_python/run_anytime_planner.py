@@ -39,10 +39,7 @@ if __name__ == "__main__":
                     is_training=False
                     )
 
-    env_core = env
-    while( not hasattr(env_core, '_elapsed_steps')):
-        env_core = env_core.env
-    env_core = env_core.env
+    env_core = env.unwrapped
 
     num_target_dep_vars = env_core.num_target_dep_vars
 
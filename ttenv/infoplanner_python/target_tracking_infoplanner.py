@@ -1,3 +1,4 @@
+from functools import partial
 import numpy as np
 from numpy import linalg as LA
 import os
@@ -24,7 +25,10 @@ class BeliefWrapper(object):
 
     def update(self, state, cov):
         self.state = np.reshape(state, (self.num_targets, self.dim))
-        self.cov = [cov[n*self.dim: (n+1)*self.dim,n*self.dim: (n+1)*self.dim ] for n in range(self.num_targets)]
+        # The diagonal blocks of cov, [num_targets, dim, dim].
+        idx = np.arange(self.num_targets)
+        self.cov = np.reshape(cov, (self.num_targets, self.dim,
+                                self.num_targets, self.dim))[idx, :, idx, :]
 
 class TargetWrapper(object):
     def __init__(self, num_targets=1, dim=4):
@@ -60,7 +64,7 @@ class TargetTrackingInfoPlanner2(TargetTrackingEnv1):
         self.info_targets = FeedTargetWrapper(num_targets)
 
     def reset(self, **kwargs):
-        self.has_discovered = [0] * self.num_targets
+        self.has_discovered = np.zeros(self.num_targets, dtype=np.int8)
         self.state = []
         self.num_collisions = 0
 
@@ -108,8 +112,7 @@ class TargetTrackingInfoPlanner2(TargetTrackingEnv1):
         observed = self.observe_and_update_belief()
 
         # Predict the target for the next step, b_1|0.
-        for i in range(self.num_targets):
-            self.belief_targets[i].predict()
+        self.predict_beliefs()
 
         # Compute the RL state.
         self.state_func([0.0, 0.0], observed)
@@ -138,8 +141,7 @@ class TargetTrackingInfoPlanner2(TargetTrackingEnv1):
         reward, done, mean_nlogdetcov, std_nlogdetcov = self.get_reward(self.is_training, is_col=False)
 
         # Predict the target for the next step, b_t+2|t+1
-        for i in range(self.num_targets):
-            self.belief_targets[i].predict()
+        self.predict_beliefs()
 
         # Compute the RL state.
         self.state_func(action_vw, observed)
@@ -169,7 +171,7 @@ class TargetTrackingInfoPlanner2(TargetTrackingEnv1):
         self.cfg = Configure(map_nd, cmap_data)
         sensor = infoplanner.IGL.RangeBearingSensor(self.sensor_r, self.fov, self.sensor_r_sd, self.sensor_b_sd, map_nd, cmap_data)
         self.agent = Agent_InfoPlanner(dim=3, sampling_period=self.sampling_period, limit=self.limit['agent'],
-                            collision_func=lambda x: self.MAP.is_collision(x, margin=0.0),
+                            collision_func=partial(self.MAP.is_collision, margin=0.0),
                             se2_env=se2_env, sensor_obj=sensor)
 
         if const_q is None:
@@ -178,31 +180,37 @@ class TargetTrackingInfoPlanner2(TargetTrackingEnv1):
             self.const_q = const_q
 
         # Build targets
-        self.targetA = np.concatenate((np.concatenate((np.eye(2), self.sampling_period*np.eye(2)), axis=1),
-                                        [[0,0,1,0],[0,0,0,1]]))
-        self.target_noise_cov = self.const_q * np.concatenate((
-                            np.concatenate((self.sampling_period**3/3*np.eye(2), self.sampling_period**2/2*np.eye(2)), axis=1),
-                        np.concatenate((self.sampling_period**2/2*np.eye(2), self.sampling_period*np.eye(2)),axis=1) ))
+        self.targetA = util.block_eye_2d(1.0, self.sampling_period, 0.0, 1.0)
+        self.target_noise_cov = self.const_q * util.block_eye_2d(
+                                self.sampling_period**3/3, self.sampling_period**2/2,
+                                self.sampling_period**2/2, self.sampling_period)
         if known_noise:
             self.target_true_noise_sd = self.target_noise_cov
         else:
-            self.target_true_noise_sd = self.const_q_true * np.concatenate((
-                        np.concatenate((self.sampling_period**2/2*np.eye(2), self.sampling_period/2*np.eye(2)), axis=1),
-                        np.concatenate((self.sampling_period/2*np.eye(2), self.sampling_period*np.eye(2)),axis=1) ))
+            self.target_true_noise_sd = self.const_q_true * util.block_eye_2d(
+                                self.sampling_period**2/2, self.sampling_period/2,
+                                self.sampling_period/2, self.sampling_period)
 
+        # The target states are stored in a shared array.
+        self.target_states = np.zeros((self.num_targets, self.target_dim))
         self.targets = [AgentDoubleInt2D_Nonlinear(self.target_dim,
                             self.sampling_period, self.limit['target'],
-                            lambda x: self.MAP.is_collision(x),
+                            self.MAP.is_collision,
                             W=self.target_true_noise_sd, A=self.targetA,
-                            obs_check_func=lambda x: self.MAP.get_closest_obstacle(
-                                x, fov=2*np.pi, r_max=10e2))
-                            for _ in range(self.num_targets)]
+                            obs_check_func=partial(self.MAP.get_closest_obstacle,
+                                fov=2*np.pi, r_max=10e2),
+                            state_buf=self.target_states[i])
+                            for i in range(self.num_targets)]
+        # The belief states and covariances are stored in shared arrays.
+        self.belief_states = np.zeros((self.num_targets, self.target_dim))
+        self.belief_covs = np.zeros((self.num_targets, self.target_dim, self.target_dim))
         self.belief_targets = [KFbelief(dim=self.target_dim,
                             limit=self.limit['target'], A=self.targetA,
                             W=self.target_noise_cov,
                             obs_noise_func=self.observation_noise,
-                            collision_func=lambda x: self.MAP.is_collision(x, margin=0.0))
-                            for _ in range(self.num_targets)]
+                            collision_func=partial(self.MAP.is_collision, margin=0.0),
+                            state_buf=self.belief_states[i], cov_buf=self.belief_covs[i])
+                            for i in range(self.num_targets)]
 
 class TargetTrackingInfoPlanner1(TargetTrackingEnv1):
     """
@@ -225,28 +233,25 @@ class TargetTrackingInfoPlanner1(TargetTrackingEnv1):
         self.cfg = Configure(map_nd, cmap_data)
         sensor = infoplanner.IGL.RangeBearingSensor(self.sensor_r, self.fov, self.sensor_r_sd, self.sensor_b_sd, map_nd, cmap_data)
         self.agent = Agent_InfoPlanner(dim=3, sampling_period=self.sampling_period, limit=self.limit['agent'],
-                            collision_func=lambda x: self.MAP.is_collision(x),
+                            collision_func=self.MAP.is_collision,
                             se2_env=se2_env, sensor_obj=sensor)
         self.belief_targets = BeliefWrapper(num_targets)
         self.targets = TargetWrapper(num_targets)
 
     def reset(self, **kwargs):
-        self.state = []
-        t_init_sets = []
-        t_init_b_sets = []
         init_pose = self.get_init_pose(**kwargs)
         a_init_igl = infoplanner.IGL.SE3Pose(init_pose['agent'], np.array([0, 0, 0, 1]))
-        for i in range(self.num_targets):
-            t_init_b_sets.append(init_pose['belief_targets'][i][:2])
-            t_init_sets.append(init_pose['targets'][i][:2])
-            r, alpha = util.relative_distance_polar(np.array(t_init_b_sets[-1][:2]),
+        t_init_b_sets = [init_pose['belief_targets'][i][:2] for i in range(self.num_targets)]
+        t_init_sets = [init_pose['targets'][i][:2] for i in range(self.num_targets)]
+
+        n = self.num_target_dep_vars
+        self.state = np.zeros(n * self.num_targets + self.num_target_indep_vars, dtype=np.float32)
+        self.state[0:-2:n], self.state[1:-2:n] = util.relative_distance_polar_batch(
+                                    np.array(t_init_b_sets),
                                     xy_base=np.array(init_pose['agent'][:2]),
                                     theta_base=init_pose['agent'][2])
-            logdetcov = np.log(LA.det(self.target_init_cov*np.eye(self.target_dim)))
-            self.state.extend([r, alpha, 0.0, 0.0, logdetcov, 0.0])
-
-        self.state.extend([self.sensor_r, np.pi])
-        self.state = np.array(self.state)
+        self.state[4:-2:n] = LA.slogdet(self.target_init_cov*np.eye(self.target_dim))[1]
+        self.state[-2:] = [self.sensor_r, np.pi]
         # Build a target
         target = self.cfg.setup_integrator_targets(n_targets=self.num_targets,
                                                 init_pos=t_init_sets,
@@ -270,18 +275,20 @@ class TargetTrackingInfoPlanner1(TargetTrackingEnv1):
             penalty = METADATA['margin2wall']**2 * \
                         1./max(METADATA['margin2wall']**2, obstacles_pt[0]**2)
 
+        # Log determinants of all belief covariances in a single call, shared
+        # by the reward and the evaluation metric.
+        if sum(observed) > 0 or not(is_training):
+            logdetcov = LA.slogdet(self.belief_targets.cov)[1]
+
         if sum(observed) == 0:
             reward = - penalty
         else:
-            cov = self.agent.get_belief_cov()
-            detcov = [LA.det(cov[self.target_dim*n: self.target_dim*(n+1), self.target_dim*n: self.target_dim*(n+1)]) for n in range(self.num_targets)]
-            reward = - 0.1 * np.log(np.mean(detcov) + np.std(detcov)) - penalty
+            mean_detcov, std_detcov = util.mean_std(np.exp(logdetcov))
+            reward = - 0.1 * np.log(mean_detcov + std_detcov) - penalty
             reward = max(0.0, reward) + np.mean(observed)
 
         mean_nlogdetcov = None
         if not(is_training):
-            cov = self.agent.get_belief_cov()
-            logdetcov = [np.log(LA.det(cov[self.target_dim*n: self.target_dim*(n+1), self.target_dim*n: self.target_dim*(n+1)])) for n in range(self.num_targets)]
             mean_nlogdetcov = -np.mean(logdetcov)
 
         return reward, False, mean_nlogdetcov
@@ -299,30 +306,24 @@ class TargetTrackingInfoPlanner1(TargetTrackingEnv1):
         self.agent.update_belief(GaussianBelief)
         self.belief_targets.update(self.agent.get_belief_state(), self.agent.get_belief_cov())
 
-        observed = [m.validity for m in measurements]
+        observed = np.array([m.validity for m in measurements], dtype=bool)
         reward, done, mean_nlogdetcov = self.get_reward(obstacles_pt, observed, self.is_training)
         if obstacles_pt is None:
             obstacles_pt = (self.sensor_r, np.pi)
 
-        self.state = []
-        target_b_state = self.agent.get_belief_state()
-        target_b_cov = self.agent.get_belief_cov()
+        # Compute the target dependent variables for all targets at once.
+        b_states = self.belief_targets.state
         control_input = self.action_map[action]
-        for n in range(self.num_targets):
-            r_b, alpha_b = util.relative_distance_polar(
-                        target_b_state[self.target_dim*n: self.target_dim*n+2],
-                        xy_base=self.agent.state[:2], theta_base=self.agent.state[2])
-            r_dot_b, alpha_dot_b = util.relative_velocity_polar(
-                                    target_b_state[self.target_dim*n: self.target_dim*n+2],
-                                    target_b_state[self.target_dim*n+2:],
+        n = self.num_target_dep_vars
+        self.state = np.empty(n * self.num_targets + self.num_target_indep_vars, dtype=np.float32)
+        (self.state[0:-2:n], self.state[1:-2:n],
+            self.state[2:-2:n], self.state[3:-2:n]) = util.relative_polar_batch(
+                                    b_states[:,:2], b_states[:,2:],
                                     self.agent.state[:2], self.agent.state[2],
                                     control_input[0], control_input[1])
-            self.state.extend([r_b, alpha_b, r_dot_b, alpha_dot_b,
-                                    np.log(LA.det(target_b_cov[self.target_dim*n: self.target_dim*(n+1), self.target_dim*n: self.target_dim*(n+1)])),
-                                        float(observed[n])])
-
-        self.state.extend([obstacles_pt[0], obstacles_pt[1]])
-        self.state = np.array(self.state)
+        self.state[4:-2:n] = LA.slogdet(self.belief_targets.cov)[1]
+        self.state[5:-2:n] = observed
+        self.state[-2:] = obstacles_pt
         return self.state, reward, done, {'mean_nlogdetcov': mean_nlogdetcov}
 
 class Agent_InfoPlanner(Agent):
@@ -332,12 +333,9 @@ class Agent_InfoPlanner(Agent):
         self.se2_env = se2_env
         self.sensor = sensor_obj
         self.sampling_period = sampling_period
-        self.action_map = {}
-        self.action_map_rev = {}
-        for (i,v) in enumerate(METADATA['action_v']):
-            for (j,w) in enumerate(METADATA['action_w']):
-                self.action_map[len(METADATA['action_w'])*i+j] = (v,w)
-                self.action_map_rev[(v,w)] = len(METADATA['action_w'])*i+j
+        self.action_map = tuple((v,w) for v in METADATA['action_v']
+                                        for w in METADATA['action_w'])
+        self.action_map_rev = {vw: i for (i, vw) in enumerate(self.action_map)}
         self.vw = [0,0]
 
     def reset(self, init_state, belief_target=None):
@@ -32,6 +32,9 @@ class DynamicMap(GridMap):
                 self.obstacles.append(np.load(os.path.join(obj_lib_path, obj_f)))
         self.visit_freq_map = None
         self.visit_map = None
+        self._local_maps_buf = None
+        self._local_mapmin_surroundings = None
+        self._local_mapmin_im_size = None
 
     def generate_map(self, chosen_idx=None, rot_angs=None, **kwargs):
         self.map = np.zeros(self.mapdim)
@@ -9,6 +9,7 @@ columns are counted from left to right.
 Matplotlib.pyplot displays a matrix with (r,c)=(0,0) located at the top left.
 Therefore, in the display_wrapper, the map is flipped.
 """
+import math
 import numpy as np
 import yaml
 from ttenv.metadata import METADATA
@@ -19,6 +20,13 @@ def round(x):
     else:
         return int(x-0.5)
 
+def round_batch(x):
+    """
+    Element-wise version of round for an array input.
+    OUTPUT: an integer array of the same shape.
+    """
+    return np.where(x >= 0, np.floor(x+0.5), np.ceil(x-0.5)).astype(int)
+
 class GridMap(object):
     def __init__(self, map_path, margin2wall=0.5):
         map_config = yaml.load(open(map_path+".yaml", "r"))
@@ -35,6 +43,9 @@ class GridMap(object):
         self.origin = map_config['origin']
         self.visit_freq_map = None
         self.visit_map = None
+        self._local_maps_buf = None
+        self._local_mapmin_surroundings = None
+        self._local_mapmin_im_size = None
 
     def generate_map(self, **kwargs):
         pass
@@ -69,6 +80,18 @@ class GridMap(object):
         else:
             return False
 
+    def is_collision_ray_cell_batch(self, cell0, cell1):
+        """
+        Batch version of is_collision_ray_cell.
+        cell0, cell1 : integer arrays of the same shape, cell r, c indices from left bottom.
+        OUTPUT: a boolean array of the same shape.
+        """
+        collision = (cell0 < 0) | (cell1 < 0) | (cell0 >= self.mapdim[0]) | (cell1 >= self.mapdim[1])
+        if self.map is not None:
+            valid = ~collision
+            collision[valid] = self.map_linear[cell0[valid] + self.mapdim[0] * cell1[valid]] == 1
+        return collision
+
     def is_collision(self, pos, margin=None):
         if not(self.in_bound(pos)):
             return True
@@ -89,6 +112,33 @@ class GridMap(object):
                             return True
         return False
 
+    def is_collision_batch(self, pos, margin=None):
+        """
+        Batch version of is_collision.
+        pos : [batch_size, 2 or 3]
+        OUTPUT: [batch_size,] boolean array
+        """
+        pos = np.asarray(pos)[:,:2]
+        collision = np.any((pos < self.mapmin + self.margin2wall)
+                            | (pos > self.mapmax - self.margin2wall), axis=1)
+        if self.map is None:
+            return collision
+        idx = np.flatnonzero(~collision)
+        cell = np.minimum([self.mapdim[0]-1, self.mapdim[1]-1],
+                            round_batch((pos[idx] - self.mapmin)/self.mapres - 0.5))
+        if margin is None:
+            margin = self.margin2wall
+        if margin == 0.0:
+            collision[idx] = self.is_collision_ray_cell_batch(cell[:,0], cell[:,1])
+            return collision
+        n = np.ceil(margin/self.mapres).astype(np.int16)
+        r_add, c_add = np.meshgrid(np.arange(-n[1],n[1],1), np.arange(-n[0],n[0],1),
+                                    indexing='ij')
+        x_c = np.clip(cell[:,:1] + r_add.ravel(), 0, self.mapdim[0]-1)
+        y_c = np.clip(cell[:,1:] + c_add.ravel(), 0, self.mapdim[1]-1)
+        collision[idx] = np.any(self.map_linear[x_c + self.mapdim[0] * y_c] == 1, axis=1)
+        return collision
+
     def in_bound(self, pos):
         return not((pos[0] < self.mapmin[0] + self.margin2wall)
             or (pos[0] > self.mapmax[0] - self.margin2wall)
@@ -108,13 +158,28 @@ class GridMap(object):
             return False
         start_rc = self.se2_to_cell(start_pos)
         end_rc = self.se2_to_cell(end_pos)
-        ray_cells = bresenham2D(start_rc[0], start_rc[1], end_rc[0], end_rc[1])
-        i = 0
-        while(i < ray_cells.shape[-1]):
-            if self.is_collision_ray_cell(ray_cells[:,i]):
-                return True
-            i += 1
-        return False
+        ray_cells = bresenham2D(start_rc[0], start_rc[1], end_rc[0], end_rc[1]).astype(int)
+        return bool(self.is_collision_ray_cell_batch(ray_cells[0], ray_cells[1]).any())
+
+    def is_blocked_batch(self, start_pos, end_pos):
+        """
+        Batch version of is_blocked from a single start position.
+        end_pos : [batch_size, 2 or 3]
+        OUTPUT: [batch_size,] boolean array
+        """
+        blocked = np.zeros(len(end_pos), dtype=bool)
+        if self.map is None or len(end_pos) == 0:
+            return blocked
+        start_rc = self.se2_to_cell(start_pos)
+        ray_cells = [bresenham2D(start_rc[0], start_rc[1], *self.se2_to_cell(pos))
+                        for pos in end_pos]
+        # Check the cells of all rays at once and reduce them per ray.
+        ray_len = [rc.shape[-1] for rc in ray_cells]
+        ray_cells = np.concatenate(ray_cells, axis=1).astype(int)
+        collision = self.is_collision_ray_cell_batch(ray_cells[0], ray_cells[1])
+        blocked[:] = np.logical_or.reduceat(collision,
+                                    np.concatenate(([0], np.cumsum(ray_len)[:-1])))
+        return blocked
 
     def get_front_obstacle(self, odom, r_max=METADATA['sensor_r'], **kwargs):
         """
@@ -134,7 +199,7 @@ class GridMap(object):
                         break
                     i += 1
                 if i < ray_cells.shape[-1]: # break!
-                    ro_min_t = np.sqrt(np.sum(np.square(pt - odom[:2])))
+                    ro_min_t = math.hypot(pt[0] - odom[0], pt[1] - odom[1])
         else:
             end_rc = self.se2_to_cell(end_pt_global_frame)
             ray_cells = bresenham2D(start_rc[0], start_rc[1], end_rc[0], end_rc[1])
@@ -144,46 +209,56 @@ class GridMap(object):
                     break
                 i += 1
             if i < ray_cells.shape[-1]:
-                ro_min_t = np.sqrt(np.sum(np.square(self.cell_to_se2(ray_cells[:,i]) - odom[:2])))
+                pt = self.cell_to_se2(ray_cells[:,i])
+                ro_min_t = math.hypot(pt[0] - odom[0], pt[1] - odom[1])
         if ro_min_t is None:
             return None
         else:
             return ro_min_t, 0.0
 
-    def get_closest_obstacle(self, odom, ang_res=0.05,
-                fov=METADATA['fov']/180.0*np.pi, r_max=METADATA['sensor_r']):
+    def trace_fov_rays(self, odom, ang_res, fov, r_max):
         """
-        Return radial and angular distances of the closest obstacle/boundary cell
+        Traces rays with the angular resolution ang_res over the field of
+        view fov from odom, up to the distance r_max. Each ray is traced until
+        it leaves the map at the latest.
+        OUTPUT: ang_grid, ray cells of all rays concatenated [2, num_cells],
+                and the index of the first cell of each ray in ray cells.
         """
-        odom = np.array(odom)
         ang_grid = np.arange(-.5*fov, .5*fov, ang_res)
-        closest_obstacle = (r_max, 0.0)
         start_rc = self.se2_to_cell(odom[:2])
         cs_ang_grid = r_max * np.array([np.cos(ang_grid), np.sin(ang_grid)])
         end_pt_global_frame = coord_change2g(cs_ang_grid, odom[-1]) + odom[:2, np.newaxis]
         end_rc = se2_to_cell_batch(end_pt_global_frame.T, self.mapmin, self.mapres)
-        for j in range(len(ang_grid)):
-            ray_cells = bresenham2D(start_rc[0], start_rc[1], end_rc[0][j], end_rc[1][j])
-            i = 0
-            if self.map is None:
-                while(i < ray_cells.shape[-1]):
-                    pt = self.cell_to_se2(ray_cells[:,i])
-                    if not(self.in_bound(pt)):
-                        break
-                    i += 1
-                if i < ray_cells.shape[-1]: # break!
-                    ro_min_t = np.sqrt(np.sum(np.square(pt - odom[:2])))
-                    if ro_min_t < closest_obstacle[0]:
-                        closest_obstacle = (ro_min_t, ang_grid[j])
-            else:
-                while(i < ray_cells.shape[-1]): # break!
-                    if self.is_collision_ray_cell(ray_cells[:,i]):
-                        break
-                    i += 1
-                if i < ray_cells.shape[-1]:
-                    ro_min_t = np.sqrt(np.sum(np.square(self.cell_to_se2(ray_cells[:,i]) - odom[:2])))
-                    if ro_min_t < closest_obstacle[0]:
-                        closest_obstacle = (ro_min_t, ang_grid[j])
+        # A ray leaves the map within max(mapdim) cells along its major axis,
+        # so its cells after that are never reached by a caller.
+        max_len = max(self.mapdim) + 1
+        ray_cells = [bresenham2D(start_rc[0], start_rc[1], end_rc[0][j], end_rc[1][j],
+                        max_len=max_len) for j in range(len(ang_grid))]
+        ray_start = np.cumsum([0] + [rc.shape[-1] for rc in ray_cells[:-1]])
+        return ang_grid, np.concatenate(ray_cells, axis=1).astype(int), ray_start
+
+    def get_closest_obstacle(self, odom, ang_res=0.05,
+                fov=METADATA['fov']/180.0*np.pi, r_max=METADATA['sensor_r']):
+        """
+        Return radial and angular distances of the closest obstacle/boundary cell
+        """
+        odom = np.array(odom)
+        ang_grid, ray_cells, ray_start = self.trace_fov_rays(odom, ang_res, fov, r_max)
+        if self.map is None:
+            pts = self.cell_to_se2(ray_cells.T)
+            hit = np.any((pts < self.mapmin + self.margin2wall)
+                            | (pts > self.mapmax - self.margin2wall), axis=1)
+        else:
+            hit = self.is_collision_ray_cell_batch(ray_cells[0], ray_cells[1])
+        # The first hit cell of each ray, or len(hit) if there is none.
+        first_hit = np.minimum.reduceat(np.where(hit, np.arange(len(hit)), len(hit)),
+                                        ray_start)
+        closest_obstacle = (r_max, 0.0)
+        for j in np.flatnonzero(first_hit < len(hit)):
+            pt = self.cell_to_se2(ray_cells[:,first_hit[j]])
+            ro_min_t = math.hypot(pt[0] - odom[0], pt[1] - odom[1])
+            if ro_min_t < closest_obstacle[0]:
+                closest_obstacle = (ro_min_t, ang_grid[j])
         if closest_obstacle[0] == r_max:
             return None
         else:
@@ -195,63 +270,73 @@ class GridMap(object):
         Update the visit frequency map from the given odometry.
         """
         odom = np.array(odom)
-        ang_grid = np.arange(-.5*fov, .5*fov, ang_res)
-        closest_obstacle = (r_max, 0.0)
-        start_rc = self.se2_to_cell(odom[:2])
-        cs_ang_grid = r_max * np.array([np.cos(ang_grid), np.sin(ang_grid)])
-        end_pt_global_frame = coord_change2g(cs_ang_grid, odom[-1]) + odom[:2, np.newaxis]
-        end_rc = se2_to_cell_batch(end_pt_global_frame.T, self.mapmin, self.mapres)
+        _, ray_cells, ray_start = self.trace_fov_rays(odom, ang_res, fov, r_max)
         self.decay_visit_freq_map(decay_factor)
-        visit_map_tmp = np.zeros(self.mapdim)
-        for j in range(len(ang_grid)):
-            ray_cells = bresenham2D(start_rc[0], start_rc[1], end_rc[0][j], end_rc[1][j])
-            i = 0
-            while(i < ray_cells.shape[-1]): # break!
-                if self.is_collision_ray_cell(ray_cells[:,i]):
-                    break
-                if self.visit_freq_map is not None:
-                    self.visit_freq_map[ray_cells[0,i], ray_cells[1,i]] = 1.0
-                if self.visit_map is not None and not(observed):
-                    # self.visit_map[ray_cells[0,i], ray_cells[1,i]] += 1.0
-                    visit_map_tmp[ray_cells[0,i], ray_cells[1,i]] = 1.0
-                i += 1
+        # The cells of each ray before its first collision cell are visited.
+        collision = self.is_collision_ray_cell_batch(ray_cells[0], ray_cells[1])
+        ray_idx = np.arange(len(collision))
+        first_hit = np.minimum.reduceat(np.where(collision, ray_idx, len(collision)),
+                                        ray_start)
+        ray_id = np.repeat(np.arange(len(ray_start)), np.diff(np.append(ray_start, len(collision))))
+        visited = ray_cells[:, ray_idx < first_hit[ray_id]]
+        if self.visit_freq_map is not None:
+            self.visit_freq_map[visited[0], visited[1]] = 1.0
         if self.visit_map is not None and not(observed):
+            visit_map_tmp = np.zeros(self.mapdim)
+            visit_map_tmp[visited[0], visited[1]] = 1.0
             self.visit_map += visit_map_tmp
 
-    def local_map_helper(self, im_size, odom, local_mapmin, R, get_visit_freq=False):
+    def local_map_helper(self, im_size, odom, local_mapmin, R, get_visit_freq=False,
+                                                local_map=None, local_visit_freq_map=None):
         """
         Helper function to generate a local map from the global map.
         For the visit frequency local map, it assigns 2.0 for an obstacle cell,
         and a value in (0,1) for an empty cell with its visit frequency value.
+        local_map and local_visit_freq_map are optional (im_size, im_size)
+        arrays to write the maps into.
         """
-        local_map = np.zeros((im_size, im_size))
-        local_visit_freq_map = np.zeros((im_size, im_size)) if get_visit_freq else None
-        for r in range(im_size):
-            for c in range(im_size):
-                xy_local = cell_to_se2([r,c], local_mapmin, self.mapres)
-                xy_global = np.matmul(R, xy_local) + odom[:2]
-                cell_global = self.se2_to_cell(xy_global)
-                local_map[c,r] = int(self.is_collision_ray_cell(cell_global))
-                if get_visit_freq:
-                    # Cells with an obstacle have 2.0. Others have visit frequency value from the global map.
-                    if local_map[c,r] == 1 :
-                        local_visit_freq_map[c,r] = 2.0
-                    elif self.in_bound(xy_global):
-                        local_visit_freq_map[c,r] += self.visit_freq_map[cell_global[0], cell_global[1]]
+        if local_map is None:
+            local_map = np.empty((im_size, im_size), dtype=np.float32)
+        if get_visit_freq:
+            if local_visit_freq_map is None:
+                local_visit_freq_map = np.zeros((im_size, im_size), dtype=np.float32)
+            else:
+                local_visit_freq_map[:] = 0.0
+        # Global coordinates and cells of all local cells at once. The index
+        # (r, c) of the arrays below corresponds to the local cell [r, c]
+        # which is stored at [c, r] in the local maps.
+        x_local = (np.arange(im_size) + 0.5) * self.mapres[0] + local_mapmin[0]
+        y_local = (np.arange(im_size) + 0.5) * self.mapres[1] + local_mapmin[1]
+        x_global = R[0,0] * x_local[:, np.newaxis] + R[0,1] * y_local + odom[0]
+        y_global = R[1,0] * x_local[:, np.newaxis] + R[1,1] * y_local + odom[1]
+        cell0 = round_batch((x_global - self.mapmin[0])/self.mapres[0] - 0.5)
+        cell1 = round_batch((y_global - self.mapmin[1])/self.mapres[1] - 0.5)
+        collision = self.is_collision_ray_cell_batch(cell0, cell1)
+        local_map[:] = collision.T
+        if get_visit_freq:
+            # Cells with an obstacle have 2.0. Others have visit frequency value from the global map.
+            free = ~collision & ~((x_global < self.mapmin[0] + self.margin2wall)
+                                | (x_global > self.mapmax[0] - self.margin2wall)
+                                | (y_global < self.mapmin[1] + self.margin2wall)
+                                | (y_global > self.mapmax[1] - self.margin2wall))
+            local_visit_freq_map[collision.T] = 2.0
+            local_visit_freq_map.T[free] = self.visit_freq_map[cell0[free], cell1[free]]
 
         local_mapmin_g = np.matmul(R, local_mapmin) + odom[:2]
         return local_map, local_mapmin_g, local_visit_freq_map
 
-    def local_map(self, im_size, odom, get_visit_freq=False):
+    def local_map(self, im_size, odom, get_visit_freq=False, out=None):
         """
         Parameters:
         ---------
         im_size : the number of rows/columns
+        out : an optional (im_size, im_size) array to write the local map into.
         """
         R=np.array([[np.cos(odom[2] - np.pi/2), -np.sin(odom[2] - np.pi/2)],
                   [np.sin(odom[2] - np.pi/2), np.cos(odom[2] - np.pi/2)]])
         local_mapmin = np.array([-im_size/2*self.mapres[0], 0.0])
-        return self.local_map_helper(im_size, odom, local_mapmin, R, get_visit_freq)
+        return self.local_map_helper(im_size, odom, local_mapmin, R, get_visit_freq,
+                                        local_map=out)
 
     def local_visit_map(self, im_size, odom, get_visit_freq=True):
         """
@@ -288,12 +373,56 @@ class GridMap(object):
             local_mapmin_g.append(local_mapmin_g_i)
         return None, local_mapmin_g, np.array(local_visit_maps)
 
-def bresenham2D(sx, sy, ex, ey):
+    def local_map_and_visit_surroundings(self, im_size, odom, out=None):
+        """
+        Return the local map (see local_map) and the local visit frequency maps
+        of the surrounding areas (see local_visit_map_surroundings) in a single
+        call. The rotation and the local frames are computed once and the maps
+        are written into out or, if out is None, a (5, im_size, im_size) buffer
+        reused over calls.
+        Parameters:
+        ---------
+        im_size : the number of rows/columns
+        out : an optional (5, im_size, im_size) array (or a strided view) to
+            write the maps into.
+
+        OUTPUT: local_maps, the array the maps are written into where
+        local_maps[0] is the local map and local_maps[1:] are the visit
+        frequency maps of the left, right, front, and back areas, and a (5, 2)
+        array of their local_mapmin_g.
+        """
+        if self._local_mapmin_surroundings is None or self._local_mapmin_im_size != im_size:
+            self._local_mapmin_im_size = im_size
+            self._local_mapmin_surroundings = np.array([ # The local map, then the left, right, front, back surroundings
+                [-im_size/2*self.mapres[0], 0.0],
+                [-im_size/2*3*self.mapres[0], 0.0],
+                [im_size/2*self.mapres[0], 0.0],
+                [-im_size/2*self.mapres[0], im_size*self.mapres[1]],
+                [-im_size/2*self.mapres[0], -im_size*self.mapres[1]],
+                ])
+        if out is not None:
+            local_maps = out
+        else:
+            if self._local_maps_buf is None or self._local_maps_buf.shape[-1] != im_size:
+                self._local_maps_buf = np.zeros((5, im_size, im_size), dtype=np.float32)
+            local_maps = self._local_maps_buf
+        local_mapmin = self._local_mapmin_surroundings
+        R=np.array([[np.cos(odom[2] - np.pi/2), -np.sin(odom[2] - np.pi/2)],
+                  [np.sin(odom[2] - np.pi/2), np.cos(odom[2] - np.pi/2)]])
+        self.local_map_helper(im_size, odom, local_mapmin[0], R, local_map=local_maps[0])
+        for i in range(1, 5):
+            self.local_map_helper(im_size, odom, local_mapmin[i], R,
+                        get_visit_freq=True, local_visit_freq_map=local_maps[i])
+        local_mapmin_g = np.matmul(local_mapmin, R.T) + odom[:2]
+        return local_maps, local_mapmin_g
+
+def bresenham2D(sx, sy, ex, ey, max_len=None):
     """
     Bresenham's ray tracing algorithm in 2D from ESE650 2017 TA resources
     Inputs:
         (sx, sy)  start point of ray
         (ex, ey)  end point of ray
+        max_len   if given, only the first max_len cells of the ray are traced
     Outputs:
         Indicies for x-axis and y-axis
     """
@@ -306,26 +435,29 @@ def bresenham2D(sx, sy, ex, ey):
     steep = abs(dy)>abs(dx)
     if steep:
         dx,dy = dy,dx # swap
+    n = dx+1 if max_len is None else min(dx+1, max_len)
 
     if dy == 0:
-        q = np.zeros((dx+1,1))
-    else:
+        q = np.zeros((n,1))
+    elif n == dx+1:
         q = np.append(0,np.greater_equal(np.diff(np.mod(np.arange( np.floor(dx/2), -dy*dx+np.floor(dx/2)-1,-dy),dx)),0))
+    else:
+        q = np.append(0,np.greater_equal(np.diff(np.mod(np.arange( np.floor(dx/2), -dy*n+np.floor(dx/2),-dy),dx)),0))
 
     if steep:
         if sy <= ey:
-            y = np.arange(sy,ey+1)
+            y = np.arange(sy,sy+n)
         else:
-            y = np.arange(sy,ey-1,-1)
+            y = np.arange(sy,sy-n,-1)
         if sx <= ex:
             x = sx + np.cumsum(q)
         else:
             x = sx - np.cumsum(q)
     else:
         if sx <= ex:
-            x = np.arange(sx,ex+1)
+            x = np.arange(sx,sx+n)
         else:
-            x = np.arange(sx,ex-1,-1)
+            x = np.arange(sx,sx-n,-1)
         if sy <= ey:
             y = sy + np.cumsum(q)
         else:
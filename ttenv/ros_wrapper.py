@@ -61,7 +61,7 @@ class RosLog(object):
                                     for i in range(self.num_targets)]
         self.targets.append(t_state)
         self.belief_targets.append(b_state)
-        self.belief_covs.append([env.belief_targets[i].cov for i in range(env.num_targets)])
+        self.belief_covs.append([env.belief_targets[i].cov.copy() for i in range(env.num_targets)])
 
     def save(self, path=''):
         self.records['num_robots'] = 1
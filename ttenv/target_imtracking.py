@@ -21,77 +21,107 @@ import ttenv.util as util
 from ttenv.target_tracking import TargetTrackingEnv1
 
 class TargetTrackingEnv4(TargetTrackingEnv1):
+    num_local_maps = 1 # The number of local map images in the RL state.
+
     def __init__(self, num_targets=1, map_name='empty', is_training=True,
-                                        known_noise=True, im_size=28, **kwargs):
+                        known_noise=True, im_size=28, copy_obs=True, **kwargs):
+        """
+        copy_obs : bool
+            If False, reset() and step() return the internal observation
+            buffer itself (a C-contiguous float32 array) without copying it.
+            The returned array is overwritten at the next reset() or step(),
+            so the caller must copy it before storing it, e.g. in a replay
+            buffer.
+        """
         self.im_size = im_size
+        self.copy_obs = copy_obs
         TargetTrackingEnv1.__init__(self, num_targets=num_targets,
             map_name=map_name, is_training=is_training, known_noise=known_noise, **kwargs)
         self.id = 'TargetTracking-v4'
-        self.local_mapmin_g = None
 
     def set_limits(self, target_speed_limit=None):
         super().set_limits(target_speed_limit)
+        map_dim = self.num_local_maps * self.im_size * self.im_size
         self.observation_space = spaces.Box(
-            np.concatenate((-np.ones(self.im_size*self.im_size,), self.limit['state'][0])),
-            np.concatenate((np.ones(self.im_size*self.im_size,), self.limit['state'][1])),
+            np.concatenate((-np.ones(map_dim,), self.limit['state'][0])),
+            np.concatenate((np.ones(map_dim,), self.limit['state'][1])),
             dtype=np.float32)
 
+        # The observation buffer is filled in place at every step instead of
+        # concatenating the map and the target states.
+        self._obs_buf = np.empty(map_dim + len(self.limit['state'][0]),
+                                    dtype=self.observation_space.dtype)
+        self._map_slice = slice(0, map_dim)
+        self._state_slice = slice(map_dim, None)
+        # Persistent views of the local maps in the observation buffer and
+        # the global coordinates of their bottom left corners.
+        self.local_map = self._obs_buf[self._map_slice].reshape(
+                                self.num_local_maps, self.im_size, self.im_size)
+        self.local_mapmin_g = np.zeros((self.num_local_maps, 2))
+
     def reset(self, **kwargs):
         _ = super().reset(**kwargs)
-
-        # Get the local maps.
-        map_state = self.map_state_func()
-        return np.concatenate((map_state, self.state))
+        return self.obs_func()
 
     def step(self, action):
         _, reward, done, info = super().step(action)
+        return self.obs_func(), reward, done, info
 
+    def obs_func(self):
         # Get the local maps.
-        map_state = self.map_state_func()
-        return np.concatenate((map_state, self.state)), reward, done, info
+        self.map_state_func()
+        self._obs_buf[self._state_slice] = self.state
+        if self.copy_obs:
+            return self._obs_buf.copy()
+        return self._obs_buf
 
     def map_state_func(self):
-        self.local_map, self.local_mapmin_g, _ = self.MAP.local_map(
-                                                    self.im_size, self.agent.state)
-        # normalize the maps
-        self.local_map = [(self.local_map - 0.5) * 2]
-        self.local_mapmin_g = [self.local_mapmin_g]
-        return self.local_map[0].flatten()
+        """
+        Writes the normalized local map into self.local_map, a view of the
+        observation buffer.
+        """
+        _, self.local_mapmin_g[0], _ = self.MAP.local_map(self.im_size,
+                                        self.agent.state, out=self.local_map[0])
+        # normalize the maps in place
+        self.local_map[0] -= 0.5
+        self.local_map[0] *= 2.0
 
 class TargetTrackingEnv5(TargetTrackingEnv4):
+    num_local_maps = 5
+
     def __init__(self, num_targets=1, map_name='empty', is_training=True,
-                                        known_noise=True, im_size=28, **kwargs):
+                        known_noise=True, im_size=28, copy_obs=True, **kwargs):
         TargetTrackingEnv4.__init__(self, num_targets=num_targets,
-            map_name=map_name, is_training=is_training, known_noise=known_noise, im_size=im_size, **kwargs)
+            map_name=map_name, is_training=is_training, known_noise=known_noise,
+            im_size=im_size, copy_obs=copy_obs, **kwargs)
         self.id = 'TargetTracking-v5'
 
+    def set_limits(self, target_speed_limit=None):
+        super().set_limits(target_speed_limit)
+        # The maps are interleaved in the observation buffer in the same
+        # order as np.array(local_maps).T.flatten(). self.local_map[k] is a
+        # strided view of the k-th map.
+        self.local_map = self._obs_buf[self._map_slice].reshape(
+                self.im_size, self.im_size, self.num_local_maps).transpose(2, 1, 0)
+
     def reset(self, **kwargs):
         self.MAP.reset_visit_freq_map()
         return super().reset(**kwargs)
 
-    def set_limits(self, target_speed_limit=None):
-        super().set_limits(target_speed_limit)
-        self.observation_space = spaces.Box(
-            np.concatenate((-np.ones(5*self.im_size*self.im_size,), self.limit['state'][0])),
-            np.concatenate((np.ones(5*self.im_size*self.im_size,), self.limit['state'][1])),
-            dtype=np.float32)
-
     def map_state_func(self):
-        # Update the visit frequency map.
-        b_speed = np.mean([np.sqrt(np.sum(self.belief_targets[i].state[2:]**2)) for i in range(self.num_targets)])
+        """
+        Writes the normalized local map and the four local visit frequency
+        maps into self.local_map, a view of the observation buffer.
+        """
+        # Update the visit frequency map. self.belief_states is stacked in
+        # state_func which is always called before this function.
+        b_speed = np.mean(np.sqrt(np.sum(self.belief_states[:,2:]**2, axis=1)))
         decay_factor = np.exp(self.sampling_period*b_speed/self.sensor_r*np.log(0.7))
         self.MAP.update_visit_freq_map(self.agent.state, decay_factor)
 
-        self.local_map, self.local_mapmin_g, _ = self.MAP.local_map(
-                                                self.im_size, self.agent.state)
-        _, local_mapmin_gs, local_visit_maps = self.MAP.local_visit_map_surroundings(
-                                                self.im_size, self.agent.state)
-        # normalize the maps
-        self.local_map = [(self.local_map - 0.5) * 2]
-        for i in range(4):
-            self.local_map.append(local_visit_maps[i] - 1.0)
-
-        self.local_mapmin_g = [self.local_mapmin_g]
-        self.local_mapmin_g.extend(local_mapmin_gs)
-
-        return np.array(self.local_map).T.flatten()
+        _, self.local_mapmin_g[:] = self.MAP.local_map_and_visit_surroundings(
+                            self.im_size, self.agent.state, out=self.local_map)
+        # normalize the maps in place
+        self.local_map[0] -= 0.5
+        self.local_map[0] *= 2.0
+        self.local_map[1:] -= 1.0
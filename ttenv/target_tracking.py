@@ -34,6 +34,8 @@ TargetTrackingEnv3 : SE2 Target model with UKF belief tracker [x,y,theta,v,w]
 """
 from gym import spaces, logger
 
+import copy
+from functools import lru_cache, partial
 import numpy as np
 from numpy import linalg as LA
 
@@ -41,11 +43,39 @@ from ttenv.base import TargetTrackingBase
 from ttenv.maps import map_utils
 from ttenv.agent_models import *
 from ttenv.policies import *
-from ttenv.belief_tracker import KFbelief, UKFbelief
+from ttenv.belief_tracker import KFbelief, UKFbelief, kf_predict_batch, kf_update_batch, \
+                                    ukf_predict_batch
 from ttenv.metadata import METADATA
 import ttenv.util as util
 from ttenv.base import TargetTrackingBase
 
+@lru_cache(maxsize=32)
+def state_space(target_low, target_high, num_targets, indep_low, indep_high):
+    """
+    Limits of the RL state, the target dependent limits repeated for all
+    targets followed by the target independent limits, and their Box space.
+    They are cached and shared by environments, so the limits are read-only
+    and each environment takes a copy of the space.
+    """
+    low = np.concatenate((np.tile(target_low, num_targets), indep_low))
+    high = np.concatenate((np.tile(target_high, num_targets), indep_high))
+    low.flags.writeable = False
+    high.flags.writeable = False
+    return (low, high), spaces.Box(low, high, dtype=np.float32)
+
+@lru_cache(maxsize=8)
+def se2_vel_noise_cov(const_q, sampling_period):
+    """
+    Noise covariance of the SE2 target with velocities (x, y, theta, v, w).
+    It is cached and shared by environments, so the returned array is read-only.
+    """
+    noise_cov = np.zeros((5, 5))
+    noise_cov[[0, 1, 2], [0, 1, 2]] = const_q * sampling_period**3/3
+    noise_cov[3:, 3:] = const_q * np.array([[sampling_period, sampling_period**2/2],
+                                        [sampling_period**2/2, sampling_period]])
+    noise_cov.flags.writeable = False
+    return noise_cov
+
 class TargetTrackingEnv0(TargetTrackingBase):
     def __init__(self, num_targets=1, map_name='empty', is_training=True,
                                                     known_noise=True, **kwargs):
@@ -89,21 +119,21 @@ class TargetTrackingEnv0(TargetTrackingBase):
         if obstacles_pt is None:
             obstacles_pt = (self.sensor_r, np.pi)
 
-        self.state = []
-        for i in range(self.num_targets):
-            r_b, alpha_b = util.relative_distance_polar(
-                                            self.belief_targets[i].state[:2],
+        # Write the target dependent variables for all targets by slices.
+        n = self.num_target_dep_vars
+        self.state = np.empty(n * self.num_targets + self.num_target_indep_vars, dtype=np.float32)
+        self.state[0:-2:n], self.state[1:-2:n] = util.relative_distance_polar_batch(
+                                                self.belief_states[:,:2],
                                                 xy_base=self.agent.state[:2],
                                                 theta_base=self.agent.state[2])
-            self.state.extend([r_b, alpha_b,
-                                    np.log(LA.det(self.belief_targets[i].cov)),
-                                    float(observed[i])])
-        self.state.extend([obstacles_pt[0], obstacles_pt[1]])
-        self.state = np.array(self.state)
+        # Log determinants of all belief covariances in a single call.
+        self.state[2:-2:n] = LA.slogdet(self.belief_covs)[1]
+        self.state[3:-2:n] = observed
+        self.state[-2:] = obstacles_pt
 
         # Update the visit map for the evaluation purpose.
         if self.MAP.visit_map is not None:
-            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(np.mean(observed)))
+            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(observed.any()))
 
     def set_limits(self):
         self.num_target_dep_vars = 4
@@ -112,9 +142,12 @@ class TargetTrackingEnv0(TargetTrackingBase):
         self.limit = {} # 0: low, 1:high
         self.limit['agent'] = [np.concatenate((self.MAP.mapmin,[-np.pi])), np.concatenate((self.MAP.mapmax, [np.pi]))]
         self.limit['target'] = [self.MAP.mapmin, self.MAP.mapmax]
-        self.limit['state'] = [np.concatenate(([0.0, -np.pi, -50.0, 0.0]*self.num_targets, [0.0, -np.pi ])),
-                               np.concatenate(([600.0, np.pi, 50.0, 2.0]*self.num_targets, [self.sensor_r, np.pi]))]
-        self.observation_space = spaces.Box(self.limit['state'][0], self.limit['state'][1], dtype=np.float32)
+        limits, observation_space = state_space(
+                            (0.0, -np.pi, -50.0, 0.0),
+                            (600.0, np.pi, 50.0, 2.0),
+                            self.num_targets, (0.0, -np.pi), (self.sensor_r, np.pi))
+        self.limit['state'] = list(limits)
+        self.observation_space = copy.copy(observation_space)
         assert(len(self.limit['state'][0]) == (self.num_target_dep_vars * self.num_targets + self.num_target_indep_vars))
 
     def build_models(self, const_q=None, known_noise=True, **kwargs):
@@ -125,7 +158,7 @@ class TargetTrackingEnv0(TargetTrackingBase):
 
         # Build a robot
         self.agent = AgentSE2(dim=3, sampling_period=self.sampling_period, limit=self.limit['agent'],
-                            collision_func=lambda x: self.MAP.is_collision(x))
+                            collision_func=self.MAP.is_collision)
 
         self.target_noise_cov = self.const_q * self.sampling_period**3 / 3 * np.eye(self.target_dim)
         if known_noise:
@@ -135,14 +168,44 @@ class TargetTrackingEnv0(TargetTrackingBase):
         self.targetA = np.eye(self.target_dim)
 
         # Build a target
+        # The target states are stored in a shared array.
+        self.target_states = np.zeros((self.num_targets, self.target_dim))
         self.targets = [AgentDoubleInt2D(dim=self.target_dim, sampling_period=self.sampling_period,
                             limit=self.limit['target'],
-                            collision_func=lambda x: self.MAP.is_collision(x),
-                            A=self.targetA, W=self.target_true_noise_sd) for _ in range(self.num_targets)]
+                            collision_func=self.MAP.is_collision,
+                            A=self.targetA, W=self.target_true_noise_sd,
+                            state_buf=self.target_states[i]) for i in range(self.num_targets)]
+        # The belief states and covariances are stored in shared arrays.
+        self.belief_states = np.zeros((self.num_targets, self.target_dim))
+        self.belief_covs = np.zeros((self.num_targets, self.target_dim, self.target_dim))
         self.belief_targets = [KFbelief(dim=self.target_dim, limit=self.limit['target'], A=self.targetA,
                             W=self.target_noise_cov, obs_noise_func=self.observation_noise,
-                            collision_func=lambda x: self.MAP.is_collision(x))
-                                for _ in range(self.num_targets)]
+                            collision_func=self.MAP.is_collision,
+                            state_buf=self.belief_states[i], cov_buf=self.belief_covs[i])
+                                for i in range(self.num_targets)]
+
+    def update_beliefs(self, observed, z):
+        # All beliefs are updated at once in the shared arrays.
+        idx = np.flatnonzero(observed)
+        if len(idx) > 0:
+            b = self.belief_targets[0]
+            kf_update_batch(self.belief_states, self.belief_covs, idx, z[idx],
+                        self.agent.state, b.obs_noise_func, b.limit)
+
+    def predict_beliefs(self):
+        # All beliefs are predicted at once in the shared arrays.
+        b = self.belief_targets[0]
+        kf_predict_batch(self.belief_states, self.belief_covs, b.A, b.W, b.limit)
+
+    def update_targets(self):
+        t = self.targets[0]
+        if isinstance(t, Agent2DFixedPath):
+            return TargetTrackingBase.update_targets(self)
+        # All discovered targets are moved at once in the shared array.
+        idx = np.flatnonzero(self.has_discovered)
+        if len(idx) > 0:
+            double_int_2d_update_batch(self.target_states, idx, t.A, t.W,
+                                        self.MAP.is_collision_batch, t.limit)
 
 class TargetTrackingEnv1(TargetTrackingBase):
     def __init__(self, num_targets=1, map_name='empty', is_training=True, known_noise=True, **kwargs):
@@ -169,18 +232,21 @@ class TargetTrackingEnv1(TargetTrackingBase):
         # Reset the agent, targets, and beliefs with sampled initial positions.
         init_pose = super().reset(**kwargs)
         self.agent.reset(init_pose['agent'])
+        # Build the initial states of all targets and beliefs at once.
+        b_init = np.zeros((self.num_targets, self.target_dim))
+        b_init[:,:2] = np.asarray(init_pose['belief_targets'])[:,:2]
+        t_init = np.empty((self.num_targets, self.target_dim))
+        t_init[:,:2] = np.asarray(init_pose['targets'])[:,:2]
+        t_init[:,2:] = self.target_init_vel
         for i in range(self.num_targets):
-            self.belief_targets[i].reset(
-                        init_state=np.concatenate((init_pose['belief_targets'][i][:2], np.zeros(2))),
-                        init_cov=self.target_init_cov)
-            self.targets[i].reset(np.concatenate((init_pose['targets'][i][:2], self.target_init_vel)))
+            self.belief_targets[i].reset(init_state=b_init[i], init_cov=self.target_init_cov)
+            self.targets[i].reset(t_init[i])
 
         # The targets are observed by the agent (z_0) and the beliefs are updated (b_0).
         observed = self.observe_and_update_belief()
 
         # Predict the target for the next step, b_1|0.
-        for i in range(self.num_targets):
-            self.belief_targets[i].predict()
+        self.predict_beliefs()
 
         # Compute the RL state.
         self.state_func([0.0, 0.0], observed)
@@ -192,25 +258,22 @@ class TargetTrackingEnv1(TargetTrackingBase):
         if obstacles_pt is None:
             obstacles_pt = (self.sensor_r, np.pi)
 
-        self.state = []
-        for i in range(self.num_targets):
-            r_b, alpha_b = util.relative_distance_polar(self.belief_targets[i].state[:2],
-                                                xy_base=self.agent.state[:2],
-                                                theta_base=self.agent.state[2])
-            r_dot_b, alpha_dot_b = util.relative_velocity_polar(
-                                    self.belief_targets[i].state[:2],
-                                    self.belief_targets[i].state[2:],
+        # Compute the target dependent variables for all targets at once.
+        b_states = self.belief_states
+        n = self.num_target_dep_vars
+        self.state = np.empty(n * self.num_targets + self.num_target_indep_vars, dtype=np.float32)
+        (self.state[0:-2:n], self.state[1:-2:n],
+            self.state[2:-2:n], self.state[3:-2:n]) = util.relative_polar_batch(
+                                    b_states[:,:2], b_states[:,2:],
                                     self.agent.state[:2], self.agent.state[2],
                                     action_vw[0], action_vw[1])
-            self.state.extend([r_b, alpha_b, r_dot_b, alpha_dot_b,
-                                    np.log(LA.det(self.belief_targets[i].cov)),
-                                    float(observed[i])])
-        self.state.extend([obstacles_pt[0], obstacles_pt[1]])
-        self.state = np.array(self.state)
+        self.state[4:-2:n] = LA.slogdet(self.belief_covs)[1]
+        self.state[5:-2:n] = observed
+        self.state[-2:] = obstacles_pt
 
         # Update the visit map when there is any target not observed for the evaluation purpose.
         if self.MAP.visit_map is not None:
-            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(np.mean(observed)))
+            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(observed.any()))
 
     def set_limits(self, target_speed_limit=None):
         self.num_target_dep_vars = 6
@@ -226,9 +289,12 @@ class TargetTrackingEnv1(TargetTrackingBase):
         self.limit['agent'] = [np.concatenate((self.MAP.mapmin,[-np.pi])), np.concatenate((self.MAP.mapmax, [np.pi]))]
         self.limit['target'] = [np.concatenate((self.MAP.mapmin,[-self.target_speed_limit, -self.target_speed_limit])),
                                 np.concatenate((self.MAP.mapmax, [self.target_speed_limit, self.target_speed_limit]))]
-        self.limit['state'] = [np.concatenate(([0.0, -np.pi, -rel_speed_limit, -10*np.pi, -50.0, 0.0]*self.num_targets, [0.0, -np.pi])),
-                               np.concatenate(([600.0, np.pi, rel_speed_limit, 10*np.pi,  50.0, 2.0]*self.num_targets, [self.sensor_r, np.pi]))]
-        self.observation_space = spaces.Box(self.limit['state'][0], self.limit['state'][1], dtype=np.float32)
+        limits, observation_space = state_space(
+                            (0.0, -np.pi, -rel_speed_limit, -10*np.pi, -50.0, 0.0),
+                            (600.0, np.pi, rel_speed_limit, 10*np.pi, 50.0, 2.0),
+                            self.num_targets, (0.0, -np.pi), (self.sensor_r, np.pi))
+        self.limit['state'] = list(limits)
+        self.observation_space = copy.copy(observation_space)
         assert(len(self.limit['state'][0]) == (self.num_target_dep_vars * self.num_targets + self.num_target_indep_vars))
 
     def build_models(self, const_q=None, known_noise=True, **kwargs):
@@ -239,38 +305,52 @@ class TargetTrackingEnv1(TargetTrackingBase):
 
         # Build a robot
         self.agent = AgentSE2(dim=3, sampling_period=self.sampling_period, limit=self.limit['agent'],
-                            collision_func=lambda x: self.MAP.is_collision(x))
+                            collision_func=self.MAP.is_collision)
         # Build targets
-        self.targetA = np.concatenate((np.concatenate((np.eye(2),
-                                        self.sampling_period*np.eye(2)), axis=1),
-                                        [[0,0,1,0],[0,0,0,1]]))
-        self.target_noise_cov = self.const_q * np.concatenate((
-                            np.concatenate((self.sampling_period**3/3*np.eye(2),
-                                self.sampling_period**2/2*np.eye(2)), axis=1),
-                        np.concatenate((self.sampling_period**2/2*np.eye(2),
-                                    self.sampling_period*np.eye(2)),axis=1) ))
+        self.targetA = util.block_eye_2d(1.0, self.sampling_period, 0.0, 1.0)
+        self.target_noise_cov = self.const_q * util.block_eye_2d(
+                                self.sampling_period**3/3, self.sampling_period**2/2,
+                                self.sampling_period**2/2, self.sampling_period)
         if known_noise:
             self.target_true_noise_sd = self.target_noise_cov
         else:
-            self.target_true_noise_sd = self.const_q_true * np.concatenate((
-                        np.concatenate((self.sampling_period**2/2*np.eye(2),
-                                    self.sampling_period/2*np.eye(2)), axis=1),
-                        np.concatenate((self.sampling_period/2*np.eye(2),
-                                    self.sampling_period*np.eye(2)),axis=1) ))
+            self.target_true_noise_sd = self.const_q_true * util.block_eye_2d(
+                                self.sampling_period**2/2, self.sampling_period/2,
+                                self.sampling_period/2, self.sampling_period)
 
+        # The target states are stored in a shared array.
+        self.target_states = np.zeros((self.num_targets, self.target_dim))
         self.targets = [AgentDoubleInt2D_Nonlinear(self.target_dim,
                             self.sampling_period, self.limit['target'],
-                            lambda x: self.MAP.is_collision(x),
+                            self.MAP.is_collision,
                             W=self.target_true_noise_sd, A=self.targetA,
-                            obs_check_func=lambda x: self.MAP.get_closest_obstacle(
-                                x, fov=2*np.pi, r_max=10e2))
-                            for _ in range(self.num_targets)]
+                            obs_check_func=partial(self.MAP.get_closest_obstacle,
+                                fov=2*np.pi, r_max=10e2),
+                            state_buf=self.target_states[i])
+                            for i in range(self.num_targets)]
+        # The belief states and covariances are stored in shared arrays.
+        self.belief_states = np.zeros((self.num_targets, self.target_dim))
+        self.belief_covs = np.zeros((self.num_targets, self.target_dim, self.target_dim))
         self.belief_targets = [KFbelief(dim=self.target_dim,
                             limit=self.limit['target'], A=self.targetA,
                             W=self.target_noise_cov,
                             obs_noise_func=self.observation_noise,
-                            collision_func=lambda x: self.MAP.is_collision(x))
-                            for _ in range(self.num_targets)]
+                            collision_func=self.MAP.is_collision,
+                            state_buf=self.belief_states[i], cov_buf=self.belief_covs[i])
+                            for i in range(self.num_targets)]
+
+    def update_beliefs(self, observed, z):
+        # All beliefs are updated at once in the shared arrays.
+        idx = np.flatnonzero(observed)
+        if len(idx) > 0:
+            b = self.belief_targets[0]
+            kf_update_batch(self.belief_states, self.belief_covs, idx, z[idx],
+                        self.agent.state, b.obs_noise_func, b.limit)
+
+    def predict_beliefs(self):
+        # All beliefs are predicted at once in the shared arrays.
+        b = self.belief_targets[0]
+        kf_predict_batch(self.belief_states, self.belief_covs, b.A, b.W, b.limit)
 
 class TargetTrackingEnv2(TargetTrackingEnv0):
     def __init__(self, num_targets=1, map_name='empty', is_training=True, known_noise=True, **kwargs):
@@ -285,6 +365,13 @@ class TargetTrackingEnv2(TargetTrackingEnv0):
         # Build an agent, targets, and beliefs.
         self.build_models(const_q=METADATA['const_q'], known_noise=known_noise)
 
+    # The SE2 targets are moved and the UKF beliefs are updated one by one.
+    update_targets = TargetTrackingBase.update_targets
+    update_beliefs = TargetTrackingBase.update_beliefs
+
+    def predict_beliefs(self):
+        ukf_predict_batch(self.belief_targets)
+
     def set_limits(self, target_speed_limit=None):
         self.num_target_dep_vars = 4
         self.num_target_indep_vars = 2
@@ -298,9 +385,12 @@ class TargetTrackingEnv2(TargetTrackingEnv0):
         self.limit = {} # 0: low, 1:highs
         self.limit['agent'] = [np.concatenate((self.MAP.mapmin,[-np.pi])), np.concatenate((self.MAP.mapmax, [np.pi]))]
         self.limit['target'] = [np.concatenate((self.MAP.mapmin, [-np.pi])), np.concatenate((self.MAP.mapmax, [np.pi]))]
-        self.limit['state'] = [np.concatenate(([0.0, -np.pi, -50.0, 0.0]*self.num_targets, [0.0, -np.pi ])),
-                               np.concatenate(([600.0, np.pi, 50.0, 2.0]*self.num_targets, [self.sensor_r, np.pi]))]
-        self.observation_space = spaces.Box(self.limit['state'][0], self.limit['state'][1], dtype=np.float32)
+        limits, observation_space = state_space(
+                            (0.0, -np.pi, -50.0, 0.0),
+                            (600.0, np.pi, 50.0, 2.0),
+                            self.num_targets, (0.0, -np.pi), (self.sensor_r, np.pi))
+        self.limit['state'] = list(limits)
+        self.observation_space = copy.copy(observation_space)
         assert(len(self.limit['state'][0]) == (self.num_target_dep_vars * self.num_targets + self.num_target_indep_vars))
 
     def build_models(self, const_q=None, known_noise=True, **kwargs):
@@ -311,13 +401,16 @@ class TargetTrackingEnv2(TargetTrackingEnv0):
 
         # Build a robot
         self.agent = AgentSE2(3, self.sampling_period, self.limit['agent'],
-                            lambda x: self.MAP.is_collision(x))
+                            self.MAP.is_collision)
         # Build a target
+        # The target states are stored in a shared array.
+        self.target_states = np.zeros((self.num_targets, self.target_dim))
         self.targets = [AgentSE2(self.target_dim, self.sampling_period,
                         self.limit['target'],
-                        lambda x: self.MAP.is_collision(x),
-                        policy=SinePolicy(0.1, 0.5, 5.0, self.sampling_period))
-                        for _ in range(self.num_targets)]
+                        self.MAP.is_collision,
+                        policy=SinePolicy(0.1, 0.5, 5.0, self.sampling_period),
+                        state_buf=self.target_states[i])
+                        for i in range(self.num_targets)]
 
         self.target_noise_cov = self.const_q * self.sampling_period * np.eye(self.target_dim)
         if known_noise:
@@ -329,12 +422,16 @@ class TargetTrackingEnv2(TargetTrackingEnv0):
         # CirclePolicy(self.sampling_period, self.MAP.origin, 3.0)
         # RandomPolicy()
 
+        # The belief states and covariances are stored in shared arrays.
+        self.belief_states = np.zeros((self.num_targets, self.target_dim))
+        self.belief_covs = np.zeros((self.num_targets, self.target_dim, self.target_dim))
         self.belief_targets = [UKFbelief(dim=self.target_dim,
                             limit=self.limit['target'], fx=SE2Dynamics,
-                            W=self.target_noise_cov,
+                            fx_batch=SE2Dynamics_batch, W=self.target_noise_cov,
                             obs_noise_func=self.observation_noise,
-                            collision_func=lambda x: self.MAP.is_collision(x))
-                            for _ in range(self.num_targets)]
+                            collision_func=self.MAP.is_collision,
+                            state_buf=self.belief_states[i], cov_buf=self.belief_covs[i])
+                            for i in range(self.num_targets)]
 
 class TargetTrackingEnv3(TargetTrackingBase):
     def __init__(self, num_targets=1, map_name='empty', is_training=True, known_noise=True, **kwargs):
@@ -368,9 +465,12 @@ class TargetTrackingEnv3(TargetTrackingBase):
         self.limit['agent'] = [np.concatenate((self.MAP.mapmin,[-np.pi])), np.concatenate((self.MAP.mapmax, [np.pi]))]
         self.limit['target'] = [np.concatenate((self.MAP.mapmin, [-np.pi, -self.target_speed_limit, -np.pi])),
                                             np.concatenate((self.MAP.mapmax, [np.pi, self.target_speed_limit, np.pi]))]
-        self.limit['state'] = [np.concatenate(([0.0, -np.pi, -rel_speed_limit, -10*np.pi, -50.0, 0.0]*self.num_targets, [0.0, -np.pi ])),
-                               np.concatenate(([600.0, np.pi, rel_speed_limit, 10*np.pi, 50.0, 2.0]*self.num_targets, [self.sensor_r, np.pi]))]
-        self.observation_space = spaces.Box(self.limit['state'][0], self.limit['state'][1], dtype=np.float32)
+        limits, observation_space = state_space(
+                            (0.0, -np.pi, -rel_speed_limit, -10*np.pi, -50.0, 0.0),
+                            (600.0, np.pi, rel_speed_limit, 10*np.pi, 50.0, 2.0),
+                            self.num_targets, (0.0, -np.pi), (self.sensor_r, np.pi))
+        self.limit['state'] = list(limits)
+        self.observation_space = copy.copy(observation_space)
 
     def build_models(self, const_q=None, known_noise=True, **kwargs):
         if self.target_dim != 5:
@@ -381,12 +481,7 @@ class TargetTrackingEnv3(TargetTrackingBase):
         else:
             self.const_q = const_q
 
-        self.target_noise_cov = np.zeros((self.target_dim, self.target_dim))
-        for i in range(3):
-            self.target_noise_cov[i,i] = self.const_q * self.sampling_period**3/3
-        self.target_noise_cov[3:, 3:] = self.const_q * \
-                    np.array([[self.sampling_period, self.sampling_period**2/2],
-                             [self.sampling_period**2/2, self.sampling_period]])
+        self.target_noise_cov = se2_vel_noise_cov(self.const_q, self.sampling_period)
         if known_noise:
             self.target_true_noise_sd = self.target_noise_cov
         else:
@@ -394,22 +489,32 @@ class TargetTrackingEnv3(TargetTrackingBase):
                                   self.sampling_period * np.eye(self.target_dim)
         # Build a robot
         self.agent = AgentSE2(3, self.sampling_period, self.limit['agent'],
-                            lambda x: self.MAP.is_collision(x))
+                            self.MAP.is_collision)
         # Build a target
+        # The target states are stored in a shared array.
+        self.target_states = np.zeros((self.num_targets, self.target_dim))
         self.targets = [AgentSE2(self.target_dim, self.sampling_period, self.limit['target'],
-                        lambda x: self.MAP.is_collision(x),
-                        policy=ConstantPolicy(self.target_noise_cov[3:, 3:]))
-                        for _ in range(self.num_targets)]
+                        self.MAP.is_collision,
+                        policy=ConstantPolicy(self.target_noise_cov[3:, 3:]),
+                        state_buf=self.target_states[i])
+                        for i in range(self.num_targets)]
         # SinePolicy(0.5, 0.5, 2.0, self.sampling_period)
         # CirclePolicy(self.sampling_period, self.MAP.origin, 3.0)
         # RandomPolicy()
 
+        # The belief states and covariances are stored in shared arrays.
+        self.belief_states = np.zeros((self.num_targets, self.target_dim))
+        self.belief_covs = np.zeros((self.num_targets, self.target_dim, self.target_dim))
         self.belief_targets = [UKFbelief(dim=self.target_dim,
                             limit=self.limit['target'], fx=SE2DynamicsVel,
-                            W=self.target_noise_cov,
+                            fx_batch=SE2DynamicsVel_batch, W=self.target_noise_cov,
                             obs_noise_func=self.observation_noise,
-                            collision_func=lambda x: self.MAP.is_collision(x))
-                            for _ in range(self.num_targets)]
+                            collision_func=self.MAP.is_collision,
+                            state_buf=self.belief_states[i], cov_buf=self.belief_covs[i])
+                            for i in range(self.num_targets)]
+
+    def predict_beliefs(self):
+        ukf_predict_batch(self.belief_targets)
 
     def reset(self, **kwargs):
         # Always set the limits first.
@@ -422,20 +527,22 @@ class TargetTrackingEnv3(TargetTrackingBase):
         # Reset the agent, targets, and beliefs with sampled initial positions.
         init_pose = super().reset(**kwargs)
         self.agent.reset(init_pose['agent'])
+        # Build the initial states of all targets and beliefs at once.
+        b_init = np.zeros((self.num_targets, self.target_dim))
+        b_init[:,:3] = init_pose['belief_targets']
+        t_init = np.zeros((self.num_targets, self.target_dim))
+        t_init[:,:3] = init_pose['targets']
+        t_init[:,3] = self.target_init_vel[0]
         for i in range(self.num_targets):
-            self.belief_targets[i].reset(
-                        init_state=np.concatenate((init_pose['belief_targets'][i], np.zeros(2))),
-                        init_cov=self.target_init_cov)
-            t_init = np.concatenate((init_pose['targets'][i], [self.target_init_vel[0], 0.0]))
-            self.targets[i].reset(t_init)
-            self.targets[i].policy.reset(t_init)
+            self.belief_targets[i].reset(init_state=b_init[i], init_cov=self.target_init_cov)
+            # The policy of a target is reset together with the target.
+            self.targets[i].reset(t_init[i])
 
         # The targets are observed by the agent (z_0) and the beliefs are updated (b_0).
         observed = self.observe_and_update_belief()
 
         # Predict the target for the next step, b_1|0.
-        for i in range(self.num_targets):
-            self.belief_targets[i].predict()
+        self.predict_beliefs()
 
         # Compute the RL state.
         self.state_func([0.0, 0.0], observed)
@@ -447,19 +554,17 @@ class TargetTrackingEnv3(TargetTrackingBase):
         if obstacles_pt is None:
             obstacles_pt = (self.sensor_r, np.pi)
 
-        self.state = []
-        for i in range(self.num_targets):
-            r_b, alpha_b = util.relative_distance_polar(self.belief_targets[i].state[:2],
-                                                xy_base=self.agent.state[:2],
-                                                theta_base=self.agent.state[2])
-            r_dot_b, alpha_dot_b = util.relative_velocity_polar_se2(
-                                    self.belief_targets[i].state[:3],
-                                    self.belief_targets[i].state[3:],
+        # Compute the target dependent variables for all targets at once.
+        b_states = self.belief_states
+        n = self.num_target_dep_vars
+        self.state = np.empty(n * self.num_targets + self.num_target_indep_vars, dtype=np.float32)
+        (self.state[0:-2:n], self.state[1:-2:n],
+            self.state[2:-2:n], self.state[3:-2:n]) = util.relative_polar_se2_batch(
+                                    b_states[:,:3], b_states[:,3:],
                                     self.agent.state, action_vw)
-            self.state.extend([r_b, alpha_b, r_dot_b, alpha_dot_b,
-                                    np.log(LA.det(self.belief_targets[i].cov)), float(observed[i])])
-        self.state.extend([obstacles_pt[0], obstacles_pt[1]])
-        self.state = np.array(self.state)
+        self.state[4:-2:n] = LA.slogdet(self.belief_covs)[1]
+        self.state[5:-2:n] = observed
+        self.state[-2:] = obstacles_pt
         # Update the visit map when there is any target not observed for the evaluation purpose.
         if self.MAP.visit_map is not None:
-            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(np.mean(observed)))
+            self.MAP.update_visit_freq_map(self.agent.state, 1.0, observed=bool(observed.any()))
@@ -0,0 +1,53 @@
+import numpy as np
+from ttenv import agent_models
+
+def test_double_int_2d_update_batch():
+    # Positions with x > 5 are obstacles.
+    collision_func = lambda pos: pos[0] > 5.0
+    collision_batch_func = lambda pos: pos[:,0] > 5.0
+    for dim in [2, 4]:
+        N = 6
+        limit = [-10.0*np.ones(dim), 10.0*np.ones(dim)]
+        A = np.eye(dim)
+        if dim == 4:
+            A[:2,2:] = 0.5*np.eye(2)
+        W = 0.5*np.eye(dim)
+        np.random.seed(0)
+        # Some targets start next to the obstacle or out of the limit.
+        init_states = np.random.uniform(-12.0, 6.0, (N, dim))
+        init_states[[0, 3], 0] = 4.9
+        idx = np.array([0, 1, 3, 5])
+
+        states = init_states.copy()
+        targets = [agent_models.AgentDoubleInt2D(dim, 0.5, limit, collision_func,
+                                        A=A, W=W, state_buf=states[i])
+                    for i in range(N)]
+        np.random.seed(1)
+        is_col = [targets[i].update() for i in idx]
+
+        states_b = init_states.copy()
+        np.random.seed(1)
+        is_col_b = agent_models.double_int_2d_update_batch(states_b, idx, A, W,
+                                                    collision_batch_func, limit)
+        assert(np.array_equal(is_col_b, np.array(is_col, dtype=bool)))
+        # Same noise as drawn by the targets one by one with the same seed.
+        assert(np.allclose(states_b, states))
+    print("PASSED double_int_2d_update_batch()")
+
+def test_se2_dynamics_batch():
+    np.random.seed(0)
+    x = np.random.uniform([-5.0, -5.0, -np.pi, -2.0, -1.0], [5.0, 5.0, np.pi, 2.0, 1.0], (11, 5))
+    # Include a small angular velocity for the straight line motion.
+    x[0, 4] = 1e-4
+    u = np.array([1.5, 0.3])
+    x_b = agent_models.SE2Dynamics_batch(x[:,:3], 0.5, u)
+    xv_b = agent_models.SE2DynamicsVel_batch(x, 0.5)
+    for i in range(len(x)):
+        assert(np.allclose(x_b[i], agent_models.SE2Dynamics(x[i,:3], 0.5, u)))
+        assert(np.allclose(xv_b[i], agent_models.SE2DynamicsVel(x[i], 0.5)))
+    print("PASSED SE2Dynamics_batch(), SE2DynamicsVel_batch()")
+
+if __name__ == "__main__":
+    print("TEST AGENT_MODELS.PY...")
+    test_double_int_2d_update_batch()
+    test_se2_dynamics_batch()
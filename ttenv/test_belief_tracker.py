@@ -0,0 +1,82 @@
+import numpy as np
+from ttenv import agent_models, belief_tracker
+
+def test_kf_batch():
+    np.random.seed(0)
+    obs_noise_cov = np.diag([0.2, 0.01])
+    x_t = np.array([1.0, -2.0, 0.4])
+    for dim in [2, 4]:
+        N = 5
+        # Some of the states are out of the limit to check the clipping.
+        limit = [-15.0*np.ones(dim), 15.0*np.ones(dim)]
+        A = np.eye(dim)
+        if dim == 4:
+            A[:2,2:] = 0.5*np.eye(2)
+        W = 0.1*np.eye(dim)
+        states = np.random.uniform(-20.0, 20.0, (N, dim))
+        covs = np.array([M @ M.T + np.eye(dim) for M in np.random.random((N, dim, dim))])
+        # The scalar beliefs on their own arrays as references.
+        beliefs = [belief_tracker.KFbelief(dim, limit, A=A, W=W,
+                            obs_noise_func=lambda z: obs_noise_cov)
+                    for _ in range(N)]
+        for (b, s, c) in zip(beliefs, states, covs):
+            b.state, b.cov = s, c
+
+        belief_tracker.kf_predict_batch(states, covs, A, W, limit)
+        for b in beliefs:
+            b.predict()
+        assert(np.allclose(states, [b.state for b in beliefs]))
+        assert(np.allclose(covs, [b.cov for b in beliefs]))
+
+        # Only a subset of the beliefs is observed.
+        idx = np.array([0, 2, 3])
+        z = np.random.uniform([1.0, -np.pi], [10.0, np.pi], (len(idx), 2))
+        belief_tracker.kf_update_batch(states, covs, idx, z, x_t,
+                                lambda z: obs_noise_cov, limit)
+        for (i, z_t) in zip(idx, z):
+            beliefs[i].update(z_t, x_t)
+        assert(np.allclose(states, [b.state for b in beliefs]))
+        assert(np.allclose(covs, [b.cov for b in beliefs]))
+    print("PASSED kf_predict_batch(), kf_update_batch()")
+
+def test_ukf_batch():
+    obs_noise_cov = np.diag([0.2, 0.01])
+    x_t = np.array([1.0, -2.0, 0.4])
+    for (dim, fx, fx_batch) in [
+            (3, agent_models.SE2Dynamics, agent_models.SE2Dynamics_batch),
+            (5, agent_models.SE2DynamicsVel, agent_models.SE2DynamicsVel_batch)]:
+        N = 4
+        limit = [-50.0*np.ones(dim), 50.0*np.ones(dim)]
+        limit[0][2], limit[1][2] = -np.pi, np.pi
+        np.random.seed(0)
+        init_states = np.random.uniform(-10.0, 10.0, (N, dim))
+        init_states[:,2] = np.random.uniform(-np.pi, np.pi, N)
+        # The beliefs propagating one sigma point at a time as references.
+        beliefs = [belief_tracker.UKFbelief(dim, limit, fx=fx, W=0.1*np.eye(dim),
+                        obs_noise_func=lambda z: obs_noise_cov) for _ in range(N)]
+        beliefs_b = [belief_tracker.UKFbelief(dim, limit, fx=fx, fx_batch=fx_batch,
+                        W=0.1*np.eye(dim), obs_noise_func=lambda z: obs_noise_cov)
+                        for _ in range(N)]
+        for (b, b_b, s) in zip(beliefs, beliefs_b, init_states):
+            b.reset(s, 2.0)
+            b_b.reset(s, 2.0)
+
+        for _ in range(3):
+            np.random.seed(1)
+            for b in beliefs:
+                b.predict()
+            np.random.seed(1)
+            belief_tracker.ukf_predict_batch(beliefs_b)
+            z = np.random.uniform([1.0, -np.pi], [10.0, np.pi], (N, 2))
+            for (b, b_b, z_t) in zip(beliefs, beliefs_b, z):
+                b.update(z_t, x_t)
+                b_b.update(z_t, x_t)
+            for (b, b_b) in zip(beliefs, beliefs_b):
+                assert(np.allclose(b.state, b_b.state))
+                assert(np.allclose(b.cov, b_b.cov))
+    print("PASSED BatchUnscentedKalmanFilter, ukf_predict_batch()")
+
+if __name__ == "__main__":
+    print("TEST BELIEF_TRACKER.PY...")
+    test_kf_batch()
+    test_ukf_batch()
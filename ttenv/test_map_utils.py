@@ -0,0 +1,23 @@
+import os
+import numpy as np
+from ttenv.maps import map_utils
+
+def test_is_blocked_batch():
+    np.random.seed(0)
+    map_dir_path = os.path.dirname(map_utils.__file__)
+    for map_name in ['obstacles02', 'obstacles05']:
+        MAP = map_utils.GridMap(map_path=os.path.join(map_dir_path, map_name))
+        for _ in range(20):
+            start_pos = np.random.uniform(MAP.mapmin, MAP.mapmax)
+            # Include end positions out of the map and at the start position.
+            end_pos = np.random.uniform(MAP.mapmin - 5.0, MAP.mapmax + 5.0, (30, 2))
+            end_pos[0] = start_pos
+            blocked = MAP.is_blocked_batch(start_pos, end_pos)
+            assert(blocked.dtype == bool)
+            assert(np.array_equal(blocked, [MAP.is_blocked(start_pos, pos) for pos in end_pos]))
+        assert(len(MAP.is_blocked_batch(start_pos, np.zeros((0, 2)))) == 0)
+    print("PASSED is_blocked_batch()")
+
+if __name__ == "__main__":
+    print("TEST MAP_UTILS.PY...")
+    test_is_blocked_batch()
@@ -14,6 +14,12 @@ def test_env_util():
     assert(np.abs(y_b + 1.0) < 1e-5)
     print("PASSED transform_2d()")
 
+    vecs = np.array([[1, 1], [-2, 0.5], [0, 3]])
+    vecs_g = util.transform_2d_inv_batch(vecs, 0.3, [1, -1])
+    for i in range(len(vecs)):
+        assert(np.all(np.abs(vecs_g[i] - util.transform_2d_inv(vecs[i], 0.3, [1, -1])) < 1e-5))
+    print("PASSED transform_2d_inv_batch()")
+
     r_t_b, theta_t_b = util.relative_distance_polar(np.array([0, 2]), np.array([1, 1]), np.pi/2)
     assert(np.abs(r_t_b - np.sqrt(2)) < 1e-5)
     assert(np.abs(theta_t_b - np.pi/4) < 1e-5)
@@ -22,6 +28,49 @@ def test_env_util():
     assert(util.wrap_around(3*np.pi/2) == -np.pi/2)
     print("PASSED wrap_around()")
 
+    x = np.array([3*np.pi/2, -3*np.pi/2, 0.5, np.pi, -np.pi])
+    assert(np.all(util.wrap_around_batch(x) == [util.wrap_around(v) for v in x]))
+    print("PASSED wrap_around_batch()")
+
+    xy_t = np.array([[0, 2], [3, -1], [1, 1]])
+    xy_dot_t = np.array([[1, 0], [-0.5, 0.5], [0, 0]])
+    r_b, alpha_b = util.relative_distance_polar_batch(xy_t, np.array([1, 1]), np.pi/2)
+    r_dot_b, alpha_dot_b = util.relative_velocity_polar_batch(xy_t, xy_dot_t,
+                                            np.array([1, 1]), np.pi/2, 1.0, 0.5)
+    for i in range(len(xy_t)):
+        r, alpha = util.relative_distance_polar(xy_t[i], np.array([1, 1]), np.pi/2)
+        r_dot, alpha_dot = util.relative_velocity_polar(xy_t[i], xy_dot_t[i],
+                                            np.array([1, 1]), np.pi/2, 1.0, 0.5)
+        assert(np.abs(r_b[i] - r) < 1e-5 and np.abs(alpha_b[i] - alpha) < 1e-5)
+        assert(np.abs(r_dot_b[i] - r_dot) < 1e-5)
+        assert(np.abs(alpha_dot_b[i] - alpha_dot) < 1e-5)
+    print("PASSED relative_distance_polar_batch(), relative_velocity_polar_batch()")
+
+    polar_b = util.relative_polar_batch(xy_t, xy_dot_t, np.array([1, 1]), np.pi/2, 1.0, 0.5)
+    for (v_b, v) in zip(polar_b, (r_b, alpha_b, r_dot_b, alpha_dot_b)):
+        assert(np.all(np.abs(v_b - v) < 1e-5))
+    print("PASSED relative_polar_batch()")
+
+    xyth_t = np.array([[0, 2, 0.3], [3, -1, -2.0], [1, 1, 1.0]])
+    vw_t = np.array([[1.0, 0.5], [0.5, -0.2], [2.0, 0.0]])
+    polar_b = util.relative_polar_se2_batch(xyth_t, vw_t, np.array([1, 1, np.pi/2]), [1.0, 0.5])
+    for i in range(len(xyth_t)):
+        r, alpha = util.relative_distance_polar(xyth_t[i,:2], np.array([1, 1]), np.pi/2)
+        r_dot, alpha_dot = util.relative_velocity_polar_se2(xyth_t[i], vw_t[i],
+                                            np.array([1, 1, np.pi/2]), [1.0, 0.5])
+        for (v_b, v) in zip(polar_b, (r, alpha, r_dot, alpha_dot)):
+            assert(np.abs(v_b[i] - v) < 1e-5)
+    print("PASSED relative_polar_se2_batch()")
+
+    x = np.array([-3.5, 0.25, 12.0, 7.0])
+    mean, std = util.mean_std(x)
+    assert(np.abs(mean - np.mean(x)) < 1e-10 and np.abs(std - np.std(x)) < 1e-10)
+    print("PASSED mean_std()")
+
+    M = util.block_eye_2d(1.0, 0.5, 0.0, 1.0)
+    assert(np.array_equal(M, np.block([[np.eye(2), 0.5*np.eye(2)], [np.zeros((2,2)), np.eye(2)]])))
+    print("PASSED block_eye_2d()")
+
 if __name__ == "__main__":
     print("TEST ENV_UTIL.PY...")
     test_env_util()
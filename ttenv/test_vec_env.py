@@ -0,0 +1,36 @@
+import numpy as np
+from ttenv.vec_env import EnvWorker
+
+class CountingEnv(object):
+    """Returns the step count as the observation and 1.0 as the reward, and
+    is done at done_step."""
+    def __init__(self, done_step):
+        self.done_step = done_step
+        self.t = 0
+
+    def step(self, action):
+        self.t += 1
+        return np.array([self.t]), 1.0, self.t >= self.done_step, {'t': self.t}
+
+def test_env_worker():
+    for n_s in [0, -1]:
+        try:
+            EnvWorker('TargetTracking-v0', n_s=n_s)
+            assert(False)
+        except ValueError:
+            pass
+    print("PASSED EnvWorker n_s check")
+
+    # EnvWorker.step with a CountingEnv instead of a ttenv environment.
+    worker = EnvWorker.__new__(EnvWorker)
+    worker.env, worker.n_s = CountingEnv(done_step=5), 3
+    obs, reward, done, info = worker.step(0)
+    assert(obs[0] == 3 and reward == 3.0 and not(done) and info['t'] == 3)
+    # The steps stop at the first done step.
+    obs, reward, done, info = worker.step(0)
+    assert(obs[0] == 5 and reward == 2.0 and done and info['t'] == 5)
+    print("PASSED EnvWorker.step()")
+
+if __name__ == "__main__":
+    print("TEST VEC_ENV.PY...")
+    test_env_worker()
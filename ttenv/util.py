@@ -1,3 +1,4 @@
+import math
 import numpy as np
 from numpy import linalg as LA
 
@@ -13,16 +14,20 @@ def wrap_around(x):
     else:
         return x
 
+def wrap_around_batch(x):
+    """
+    Element-wise version of wrap_around for an array input.
+    """
+    return np.where(x >= np.pi, x - 2*np.pi, np.where(x < -np.pi, x + 2*np.pi, x))
+
 def cartesian2polar(xy):
-    r = np.sqrt(np.sum(xy**2))
-    alpha = np.arctan2(xy[1], xy[0])
-    return r, alpha
+    return math.hypot(xy[0], xy[1]), math.atan2(xy[1], xy[0])
 
 def cartesian2polar_dot(x, y, x_dot, y_dot):
     r2 = x*x + y*y
     if r2 == 0.0:
         return 0.0, 0.0
-    r_dot = (x*x_dot + y*y_dot)/np.sqrt(r2)
+    r_dot = (x*x_dot + y*y_dot)/math.sqrt(r2)
     alpha_dot = (x*y_dot - x_dot*y)/r2
     return r_dot, alpha_dot
 
@@ -52,12 +57,21 @@ def transform_2d_inv(vec, theta_base, xy_base = [0.0, 0.0]):
                     [np.sin(theta_base), np.cos(theta_base)]],
                     vec) + np.array(xy_base)
 
+def transform_2d_inv_batch(vecs, theta_base, xy_base = [0.0, 0.0]):
+    """
+    Batch version of transform_2d_inv.
+    vecs : [batch_size, 2]
+    OUTPUT: [batch_size, 2]
+    """
+    c, s = np.cos(theta_base), np.sin(theta_base)
+    return np.matmul(vecs, [[c, s], [-s, c]]) + np.array(xy_base)
+
 def rotation_2d_dot(xy_target, xy_dot_target, theta_base, theta_dot_base):
     """
     Cartesian velocity in a rotating frame.
     """
-    s_b = np.sin(theta_base)
-    c_b = np.cos(theta_base)
+    s_b = math.sin(theta_base)
+    c_b = math.cos(theta_base)
     x_dot_target_bframe = (-s_b * xy_target[0] + c_b * xy_target[1]) * theta_dot_base + \
                             c_b * xy_dot_target[0] + s_b * xy_dot_target[1]
     y_dot_target_bframe = - (c_b * xy_target[0] + s_b * xy_target[1]) * theta_dot_base - \
@@ -73,8 +87,15 @@ def transform_2d_dot(xy_target, xy_dot_target, theta_base, theta_dot_base, xy_ba
     return np.array(rotated_xy_dot_target_bframe) - np.array(rotated_xy_dot_base_bframe)
 
 def relative_distance_polar(xy_target, xy_base, theta_base):
-    xy_target_base = transform_2d(xy_target, theta_base, xy_base)
-    return cartesian2polar(xy_target_base)
+    # Same as cartesian2polar(transform_2d(xy_target, theta_base, xy_base)).
+    # It is called per target at every step with a single point, so the
+    # scalar math functions are used to avoid the numpy call overhead.
+    c_b, s_b = math.cos(theta_base), math.sin(theta_base)
+    dx = xy_target[0] - xy_base[0]
+    dy = xy_target[1] - xy_base[1]
+    x_b = c_b * dx + s_b * dy
+    y_b = - s_b * dx + c_b * dy
+    return math.hypot(x_b, y_b), math.atan2(y_b, x_b)
 
 def relative_velocity_polar(xy_target, xy_dot_target, xy_base, theta_base, v_base, w_base):
     """
@@ -89,13 +110,89 @@ def relative_velocity_polar(xy_target, xy_dot_target, xy_base, theta_base, v_bas
     v_base : translational velocity of a base frame in the global frame.
     w_base : rotational velocity of a base frame in the global frame.
     """
+    # Same as cartesian2polar_dot of transform_2d and transform_2d_dot,
+    # written with the scalar math functions as in relative_distance_polar.
     xy_dot_base = vw_to_xydot(v_base, w_base, theta_base)
-    xy_target_base = transform_2d(xy_target, theta_base, xy_base)
-    xy_dot_target_base = transform_2d_dot(xy_target, xy_dot_target, theta_base,
-                                                w_base, xy_base, xy_dot_base)
-    r_dot_b, alpha_dot_b = cartesian2polar_dot(xy_target_base[0],
-                            xy_target_base[1], xy_dot_target_base[0], xy_dot_target_base[1])
-    return r_dot_b, alpha_dot_b
+    c_b, s_b = math.cos(theta_base), math.sin(theta_base)
+    dx = xy_target[0] - xy_base[0]
+    dy = xy_target[1] - xy_base[1]
+    dx_dot = xy_dot_target[0] - xy_dot_base[0]
+    dy_dot = xy_dot_target[1] - xy_dot_base[1]
+    x_b = c_b * dx + s_b * dy
+    y_b = - s_b * dx + c_b * dy
+    x_dot_b = y_b * w_base + c_b * dx_dot + s_b * dy_dot
+    y_dot_b = - x_b * w_base - s_b * dx_dot + c_b * dy_dot
+    return cartesian2polar_dot(x_b, y_b, x_dot_b, y_dot_b)
+
+def relative_distance_polar_batch(xy_targets, xy_base, theta_base):
+    """
+    Batch version of relative_distance_polar.
+
+    Parameters:
+    ---------
+    xy_targets : [num_targets, 2] xy coordinates of targets in the global frame.
+    xy_base : xy coordinate of the origin of a base frame in the global frame.
+    theta_base : orientation of a base frame in the global frame.
+
+    OUTPUT: [num_targets,], [num_targets,]
+    """
+    c_b, s_b = np.cos(theta_base), np.sin(theta_base)
+    dxy = xy_targets - xy_base
+    x_b = c_b * dxy[:,0] + s_b * dxy[:,1]
+    y_b = - s_b * dxy[:,0] + c_b * dxy[:,1]
+    return np.hypot(x_b, y_b), np.arctan2(y_b, x_b)
+
+def relative_velocity_polar_batch(xy_targets, xy_dot_targets, xy_base, theta_base,
+                                                            v_base, w_base):
+    """
+    Batch version of relative_velocity_polar. See relative_polar_batch.
+
+    OUTPUT: [num_targets,], [num_targets,]
+    """
+    return relative_polar_batch(xy_targets, xy_dot_targets, xy_base, theta_base,
+                                                        v_base, w_base)[2:]
+
+def relative_polar_batch(xy_targets, xy_dot_targets, xy_base, theta_base,
+                                                            v_base, w_base):
+    """
+    Relative distance and velocity of targets in a given polar coordinate
+    computed in a single pass. The targets are rotated to the base frame once
+    and shared by both. rotation_2d_dot is linear in its position and velocity
+    inputs, so the relative velocity is computed from the differences between
+    the targets and the base frame directly.
+
+    Parameters:
+    ---------
+    xy_targets : [num_targets, 2] xy coordinates of targets in the global frame.
+    xy_dot_targets : [num_targets, 2] xy velocities of targets in the global frame.
+    xy_base : xy coordinate of the origin of a base frame in the global frame.
+    theta_base : orientation of a base frame in the global frame.
+    v_base : translational velocity of a base frame in the global frame.
+    w_base : rotational velocity of a base frame in the global frame.
+
+    OUTPUT: r, alpha, r_dot, alpha_dot. Each is [num_targets,].
+    """
+    c_b, s_b = np.cos(theta_base), np.sin(theta_base)
+    dxy = xy_targets - xy_base
+    dxy_dot = xy_dot_targets - np.array(vw_to_xydot(v_base, w_base, theta_base))
+    x_b = c_b * dxy[:,0] + s_b * dxy[:,1]
+    y_b = - s_b * dxy[:,0] + c_b * dxy[:,1]
+    x_dot_b = y_b * w_base + c_b * dxy_dot[:,0] + s_b * dxy_dot[:,1]
+    y_dot_b = - x_b * w_base - s_b * dxy_dot[:,0] + c_b * dxy_dot[:,1]
+    r_dot_b, alpha_dot_b = cartesian2polar_dot_batch(x_b, y_b, x_dot_b, y_dot_b)
+    return np.hypot(x_b, y_b), np.arctan2(y_b, x_b), r_dot_b, alpha_dot_b
+
+def cartesian2polar_dot_batch(x, y, x_dot, y_dot):
+    """
+    Batch version of cartesian2polar_dot. Zero is returned for a point at the
+    origin.
+    """
+    r2 = x*x + y*y
+    is_zero = (r2 == 0.0)
+    r2_safe = np.where(is_zero, 1.0, r2)
+    r_dot = np.where(is_zero, 0.0, (x*x_dot + y*y_dot)/np.sqrt(r2_safe))
+    alpha_dot = np.where(is_zero, 0.0, (x*y_dot - x_dot*y)/r2_safe)
+    return r_dot, alpha_dot
 
 def relative_velocity_polar_se2(xyth_target, vw_target, xyth_base, vw_base):
     """
@@ -115,6 +212,26 @@ def relative_velocity_polar_se2(xyth_target, vw_target, xyth_base, vw_base):
     return relative_velocity_polar(xyth_target[:2], xy_dot_target, xyth_base[:2],
                                         xyth_base[2], vw_base[0], vw_base[1])
 
+def relative_polar_se2_batch(xyth_targets, vw_targets, xyth_base, vw_base):
+    """
+    Relative distance and velocity of SE2 targets in a given polar coordinate
+    computed in a single pass (relative_distance_polar and
+    relative_velocity_polar_se2 for all targets).
+
+    Parameters
+    ---------
+    xyth_targets : [num_targets, 3] (x, y, orientation) of targets in the global frame.
+    vw_targets : [num_targets, 2] translational and rotational velocities of targets.
+    xyth_base : (x, y, orientation) of a base frame in the global frame.
+    vw_base : translational and rotational velocity of a base frame in the global frame.
+
+    OUTPUT: r, alpha, r_dot, alpha_dot. Each is [num_targets,].
+    """
+    xy_dot_targets = np.stack(vw_to_xydot_batch(vw_targets[:,0], vw_targets[:,1],
+                                                    xyth_base[2]), axis=1)
+    return relative_polar_batch(xyth_targets[:,:2], xy_dot_targets, xyth_base[:2],
+                                        xyth_base[2], vw_base[0], vw_base[1])
+
 def vw_to_xydot(v, w, theta):
     """
     Conversion from translational and rotational velocity to cartesian velocity
@@ -127,13 +244,45 @@ def vw_to_xydot(v, w, theta):
     theta : orientation of a base object in the global frame.
     """
     if w < 0.001:
-        x_dot = v * np.cos(theta + w/2)
-        y_dot = v * np.sin(theta + w/2)
+        x_dot = v * math.cos(theta + w/2)
+        y_dot = v * math.sin(theta + w/2)
     else:
-        x_dot = v/w * (np.sin(theta + w) - np.sin(theta))
-        y_dot = v/w * (np.cos(theta) - np.cos(theta + w))
+        x_dot = v/w * (math.sin(theta + w) - math.sin(theta))
+        y_dot = v/w * (math.cos(theta) - math.cos(theta + w))
+    return x_dot, y_dot
+
+def vw_to_xydot_batch(v, w, theta):
+    """
+    Batch version of vw_to_xydot for arrays of v and w (and theta).
+    """
+    small_w = w < 0.001
+    v_w = v / np.where(small_w, 1.0, w)
+    x_dot = np.where(small_w, v * np.cos(theta + w/2), v_w * (np.sin(theta + w) - np.sin(theta)))
+    y_dot = np.where(small_w, v * np.sin(theta + w/2), v_w * (np.cos(theta) - np.cos(theta + w)))
     return x_dot, y_dot
 
+def mean_std(values):
+    """
+    Mean and standard deviation of a few values as np.mean and np.std, but
+    computed with Python floats for less overhead on small arrays.
+    """
+    values = np.asarray(values).tolist()
+    n = len(values)
+    mean = sum(values) / n
+    return mean, math.sqrt(sum((v - mean)**2 for v in values) / n)
+
+def block_eye_2d(a, b, c, d):
+    """
+    Returns the 4x4 matrix [[a*I, b*I], [c*I, d*I]] with 2x2 identity matrices I,
+    e.g. the state transition and noise matrices of a 2D double integrator.
+    """
+    M = np.zeros((4, 4))
+    M[[0, 1], [0, 1]] = a
+    M[[0, 1], [2, 3]] = b
+    M[[2, 3], [0, 1]] = c
+    M[[2, 3], [2, 3]] = d
+    return M
+
 def iterative_mare(X_0, A, W, C, R, l):
     """
     Solving a modified algebraic Riccati equation for the Kalman Filter by
@@ -182,13 +331,13 @@ def get_nlogdetcov_bounds(P0, A, W, TH):
     T : Time horizon of an episode
     """
     from numpy import linalg as LA
-    upper_bound = - TH * np.log(LA.det(W))
+    upper_bound = - TH * LA.slogdet(W)[1]
     lower_bound = 0
     X = P0
     X = np.matmul(np.matmul(A, X), A.T) + W
     for _ in range(TH):
         X = np.matmul(np.matmul(A, X), A.T) + W
-        lower_bound += - np.log(LA.det(X))
+        lower_bound += - LA.slogdet(X)[1]
     return lower_bound, upper_bound
 
 def get_nlogdetcov_bounds_step(P0, A, W, TH):
@@ -208,10 +357,10 @@ def get_nlogdetcov_bounds_step(P0, A, W, TH):
     T : Time horizon of an episode
     """
     from numpy import linalg as LA
-    upper_bound = - np.log(LA.det(W))
+    upper_bound = - LA.slogdet(W)[1]
     X = P0
     X = np.matmul(np.matmul(A, X), A.T) + W
     for _ in range(TH):
         X = np.matmul(np.matmul(A, X), A.T) + W
-    lower_bound = - np.log(LA.det(X))
+    lower_bound = - LA.slogdet(X)[1]
     return lower_bound, upper_bound
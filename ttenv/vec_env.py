@@ -0,0 +1,92 @@
+"""Vectorized target tracking environments with Ray (https://github.com/ray-project/ray).
+Each environment runs in its own Ray actor and is built only once, so that
+its map stays in the actor. ray is imported only when RayVecEnv is used.
+
+RayVecEnv : num_envs environments of the same env_name stepped in parallel.
+    reset() : [num_envs, obs_dim] observations
+    step(actions) : [num_envs, obs_dim] observations, [num_envs,] rewards,
+                    [num_envs,] dones, a list of num_envs infos
+    Each actor applies the given action for n_s environment steps per step()
+    call to reduce the number of remote calls. The rewards of the n_s steps
+    are summed, done is True if any of the steps is done and the last
+    observation and info are returned.
+    The environments are not reset automatically when they are done.
+"""
+import numpy as np
+
+
+def _check_n_s(n_s):
+    if n_s < 1:
+        raise ValueError('n_s must be at least 1, the number of environment '
+                            'steps per step() call.')
+
+
+class EnvWorker(object):
+    def __init__(self, env_name, n_s=1, seed=None, **kwargs):
+        _check_n_s(n_s)
+        import ttenv
+        if seed is not None:
+            np.random.seed(seed)
+        self.env = ttenv.make(env_name, **kwargs)
+        self.n_s = n_s
+
+    def get_spaces(self):
+        return self.env.observation_space, self.env.action_space
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
+
+    def step(self, action):
+        reward_sum = 0.0
+        for _ in range(self.n_s):
+            obs, reward, done, info = self.env.step(action)
+            reward_sum += reward
+            if done:
+                break
+        return obs, reward_sum, done, info
+
+
+class RayVecEnv(object):
+    def __init__(self, env_name, num_envs, n_s=1, seed=None, **kwargs):
+        """
+        Parameters:
+        ----------
+        env_name : str
+            name of an environment. (e.g. 'TargetTracking-v0')
+        num_envs : int
+            the number of environments (Ray actors).
+        n_s : int
+            the number of environment steps per step() call.
+        seed : int
+            if given, the i-th actor seeds np.random with seed + i.
+        kwargs :
+            arguments for ttenv.make.
+        """
+        _check_n_s(n_s)
+        import ray
+        if not ray.is_initialized():
+            ray.init()
+        self._ray = ray
+        remote_worker = ray.remote(EnvWorker)
+        self.num_envs = num_envs
+        self.workers = [remote_worker.remote(env_name, n_s=n_s,
+                            seed=None if seed is None else seed + i, **kwargs)
+                            for i in range(num_envs)]
+        self.observation_space, self.action_space = ray.get(
+                                            self.workers[0].get_spaces.remote())
+
+    def reset(self, **kwargs):
+        obs = self._ray.get([w.reset.remote(**kwargs) for w in self.workers])
+        return np.array(obs, dtype=np.float32)
+
+    def step(self, actions):
+        assert(len(actions) == self.num_envs)
+        results = self._ray.get([w.step.remote(a) for (w, a) in zip(self.workers, actions)])
+        obs, rewards, dones, infos = zip(*results)
+        return np.array(obs, dtype=np.float32), np.array(rewards), \
+                    np.array(dones), list(infos)
+
+    def close(self):
+        for w in self.workers:
+            self._ray.kill(w)
+        self.workers = []